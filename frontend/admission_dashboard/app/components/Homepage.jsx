@@ -75,6 +75,7 @@ export default function Homepage() {
     const res = await fetch(`http://localhost:8000${endpoint}`, {
       method: "POST",
       body: formData,
+      credentials: "include",
     });
 
     setLoading(false);
@@ -70,6 +70,7 @@ export default function Homepage() {
     const res = await fetch(`http://localhost:8000${endpoint}`, {
       method: "POST",
       body: formData,
+      credentials: "include",
     });
 
     if (res.ok) {
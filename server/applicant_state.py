@@ -0,0 +1,126 @@
+# applicant_state.py
+"""
+Maintenance of the APPLICANT_STATE projection.
+
+APPLICANT_STATE holds one row per applicant with an offer: their latest ITERATION_OFFER row
+(itr_no, offer, scholarship, status), the fee flags from FEES_PAID and whether they are in
+WITHDRAWS. Every write path that changes those tables (uploads, fee status recomputation and
+withdrawals) calls refresh_applicant_state for the app_nos it touched, inside its own
+transaction, so a status read is a single primary-key lookup.
+
+Rebuild or verify the projection from the command line:
+
+    python applicant_state.py check      # list applicants whose row differs from the source tables
+    python applicant_state.py rebuild    # recompute every row
+"""
+import sys
+import logging
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import select, func, case, and_, literal, DateTime
+from db import engine, iteration_offer_table, fees_paid_table, withdraws_table, applicant_state_table
+from status import chunked
+
+logger = logging.getLogger(__name__)
+
+STATE_COLUMNS = [column.name for column in applicant_state_table.columns if column.name != "updated_at"]
+
+
+def state_select(app_nos: list = None):
+    """Derives APPLICANT_STATE rows from the source tables, optionally for some app_nos."""
+    latest = select(
+        iteration_offer_table.c.app_no,
+        func.max(iteration_offer_table.c.itr_no).label("itr_no"),
+    ).group_by(iteration_offer_table.c.app_no)
+    if app_nos is not None:
+        latest = latest.where(iteration_offer_table.c.app_no.in_(app_nos))
+    latest = latest.subquery()
+
+    offers = iteration_offer_table.c
+    fees = fees_paid_table.c
+    return select(
+        offers.app_no,
+        offers.itr_no,
+        offers.offer,
+        offers.scholarship,
+        offers.status,
+        func.coalesce(fees.admission_fees_status, 0).label("admission_fees_paid"),
+        func.coalesce(fees.tution_fees_status, 0).label("tution_fees_paid"),
+        case((withdraws_table.c.app_no.isnot(None), 1), else_=0).label("withdrawn"),
+        literal(datetime.now(), DateTime).label("updated_at"),
+    ).select_from(
+        latest.join(
+            iteration_offer_table,
+            and_(offers.app_no == latest.c.app_no, offers.itr_no == latest.c.itr_no),
+        )
+        .outerjoin(fees_paid_table, fees.app_no == latest.c.app_no)
+        .outerjoin(withdraws_table, withdraws_table.c.app_no == latest.c.app_no)
+    )
+
+
+def refresh_applicant_state(connection, app_nos):
+    """Recomputes the APPLICANT_STATE rows of the given applicants. Returns the rows written."""
+    app_nos = sorted({str(app_no) for app_no in app_nos if app_no is not None})
+    written = 0
+    for chunk in chunked(app_nos):
+        connection.execute(applicant_state_table.delete().where(applicant_state_table.c.app_no.in_(chunk)))
+        result = connection.execute(
+            applicant_state_table.insert().from_select(
+                [column.name for column in applicant_state_table.columns], state_select(chunk)
+            )
+        )
+        written += result.rowcount
+    if app_nos:
+        logger.info("Refreshed applicant state for %s applicants (%s rows)", len(app_nos), written)
+    return written
+
+
+def rebuild_applicant_state(connection):
+    """Recomputes APPLICANT_STATE for every applicant."""
+    connection.execute(applicant_state_table.delete())
+    result = connection.execute(
+        applicant_state_table.insert().from_select(
+            [column.name for column in applicant_state_table.columns], state_select()
+        )
+    )
+    return result.rowcount
+
+
+def check_applicant_state(connection):
+    """Returns the app_nos whose APPLICANT_STATE row is missing, extra or differs from the source tables."""
+    expected = pd.DataFrame(connection.execute(state_select()).mappings().all(), columns=[*STATE_COLUMNS, "updated_at"])
+    stored = pd.DataFrame(
+        connection.execute(select(*[applicant_state_table.c[name] for name in STATE_COLUMNS])).mappings().all(),
+        columns=STATE_COLUMNS,
+    )
+    merged = expected[STATE_COLUMNS].merge(stored, on="app_no", how="outer", suffixes=("", "_stored"), indicator=True)
+    differs = merged["_merge"] != "both"
+    for name in STATE_COLUMNS[1:]:
+        left, right = merged[name], merged[f"{name}_stored"]
+        differs |= ~((left == right) | (left.isna() & right.isna()))
+    return sorted(merged.loc[differs, "app_no"])
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "check"
+    if command == "rebuild":
+        with engine.begin() as connection:
+            rows = rebuild_applicant_state(connection)
+        print(f"Rebuilt APPLICANT_STATE with {rows} rows.")
+    elif command == "check":
+        with engine.connect() as connection:
+            mismatched = check_applicant_state(connection)
+        if not mismatched:
+            print("APPLICANT_STATE is consistent.")
+            return 0
+        print(f"{len(mismatched)} applicant(s) out of date: {', '.join(mismatched[:20])}{' ...' if len(mismatched) > 20 else ''}")
+        return 1
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv))
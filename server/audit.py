@@ -0,0 +1,76 @@
+# audit.py
+"""
+Upload audit trail in LOGS_TABLE, written by the ingest pipeline itself.
+
+Every /update and /api/withdraw/upload upload gets one LOGS_TABLE row: file name, category
+(the target table, WITHDRAWS for withdrawal lists), the user from the JWT cookie, client IP,
+rows read, bytes, and how long the ingest took. The remark records the outcome ("uploaded", "forced", "skipped" or "failed"). A successful or
+skipped upload is logged in the ingest transaction itself, so the entry exists exactly when
+the data does; a failed upload is logged in a transaction of its own after the rollback.
+"""
+import time
+import logging
+from datetime import datetime
+from db import logs_table
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_USER = "Unknown User"
+
+
+class UploadAudit:
+    """Who uploaded which file from where, and how large it was."""
+
+    def __init__(self, file_name: str, category: str, uploaded_by: str = None, ip_address: str = None):
+        self.file_name = file_name or ""
+        self.category = category
+        self.uploaded_by = uploaded_by or UNKNOWN_USER
+        self.ip_address = ip_address or ""
+        self.bytes = None
+        self.started = time.perf_counter()
+
+    def start(self):
+        """Restarts the clock, e.g. when a queued background job begins."""
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self):
+        return int((time.perf_counter() - self.started) * 1000)
+
+
+def file_size(fileobj):
+    """Size of an uploaded file in bytes. Leaves the file at position 0."""
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def write_audit(connection, audit: UploadAudit, remark: str, rows: int = None):
+    """Inserts the LOGS_TABLE entry of an upload on the caller's (sync) connection."""
+    if audit is None:
+        return
+    connection.execute(
+        logs_table.insert().values(
+            file_name=audit.file_name,
+            category=audit.category,
+            upload_date=datetime.now(),
+            uploaded_by=audit.uploaded_by,
+            remark=remark,
+            ip_address=audit.ip_address,
+            rows=rows,
+            bytes=audit.bytes,
+            duration_ms=audit.elapsed_ms(),
+        )
+    )
+
+
+def write_failed_audit(engine, audit: UploadAudit):
+    """Logs a failed upload in its own transaction; never raises over the original error."""
+    if audit is None:
+        return
+    try:
+        with engine.begin() as connection:
+            write_audit(connection, audit, "failed")
+    except Exception:
+        logger.exception("Could not write the audit entry of failed upload %s", audit.file_name)
+
@@ -1,15 +1,36 @@
 # auth.py
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import jwt
+from fastapi import HTTPException
 from passlib.context import CryptContext
+from metrics import LatencyStats
 
 # JWT Configuration – use an environment variable for production!
 SECRET_KEY = os.environ.get("SECRET_KEY", "your_secret_key_here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 # Token valid for 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor for new hashes. Stored hashes below it are re-hashed at the next login,
+# so it can be raised without locking anyone out.
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt takes 100-300 ms of CPU per call, so the async routes run it on this pool
+# (bcrypt releases the GIL) instead of on the event loop.
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", min(4, os.cpu_count() or 1)))
+# Calls waiting or running beyond this are rejected with 503 rather than queued without bound.
+PASSWORD_QUEUE_LIMIT = int(os.environ.get("PASSWORD_QUEUE_LIMIT", 64))
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Creates a JWT access token with an expiration."""
@@ -26,3 +47,73 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     """Generates a hash for the given password."""
     return pwd_context.hash(password)
+
+
+class PasswordPool:
+    """Bounded thread pool for bcrypt calls, with queue-depth and latency metrics."""
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.running = 0
+        self.max_pending = 0
+        self.rejected = 0
+        self.wait_latency = LatencyStats()
+        self.hash_latency = LatencyStats()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._workers = workers
+        self._lock = threading.Lock()
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.queue_limit:
+                self.rejected += 1
+                raise HTTPException(status_code=503, detail="Too many logins in progress, please retry shortly.")
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+        submitted = time.perf_counter()
+
+        def task():
+            self.wait_latency.record((time.perf_counter() - submitted) * 1000)
+            with self._lock:
+                self.running += 1
+            try:
+                with self.hash_latency.timer():
+                    return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+        try:
+            return await asyncio.wrap_future(self._executor.submit(task))
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def to_dict(self):
+        with self._lock:
+            counts = {
+                "workers": self._workers,
+                "queue_limit": self.queue_limit,
+                "queued": self.pending - self.running,
+                "running": self.running,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+            }
+        return {**counts, "wait_latency": self.wait_latency.to_dict(), "hash_latency": self.hash_latency.to_dict()}
+
+
+password_pool = PasswordPool(PASSWORD_WORKERS, PASSWORD_QUEUE_LIMIT)
+
+
+async def hash_password(password):
+    """get_password_hash on the password pool, for async routes."""
+    return await password_pool.run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(plain_password, hashed_password):
+    """
+    Verifies a password on the password pool. Returns (valid, new_hash); new_hash is set when
+    the stored hash uses outdated settings (e.g. fewer rounds than BCRYPT_ROUNDS) and should be saved.
+    """
+    return await password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,234 @@
+# benchmark.py
+"""
+Replays the admission flow from flow.txt through the FastAPI app and reports how the server
+performs.
+
+The bundled CSVs, optionally scaled up, are uploaded in flow order (master table, iteration 1
+offers, iteration 1 fees, iteration 2 offers, iteration 2 fees, then a withdrawal list) with
+TestClient. After every upload the dashboard and lookup endpoints are called `repeats` times.
+The report lists rows/sec for each upload, per-endpoint latency percentiles and the peak
+RSS of the process.
+
+`scale` multiplies the bundled files (10-100 for load tests). Copy k of every file has its
+app_nos suffixed with -k, so offers, fee flags and the links between the files keep the
+bundled distribution. Names and scholarships of the extra copies are resampled from the
+bundled values (scholarships per offer).
+
+Always runs against a scratch SQLite database in a temporary directory, which is removed
+afterwards: DATABASE_URL is ignored, so the configured database is never touched.
+
+Usage (from the server directory):
+    python benchmark.py [scale] [repeats] [report.json]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import logging
+import tempfile
+
+SCRATCH_DIR = tempfile.mkdtemp(prefix="benchmark-")
+# db.py and main.py create their engines on import, so they have to see the scratch URL.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'benchmark.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+from db import engine
+from metrics import LatencyStats
+from main import app
+from auth import create_access_token
+
+# Per-request INFO logging would dominate both the output and the timings.
+logging.getLogger().setLevel(logging.WARNING)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# (step, table, bundled file) in the order of flow.txt.
+FLOW = [
+    ("master", "MASTER_TABLE", "MasterFile.csv"),
+    ("iteration 1", "ITERATION_OFFER", "Iteration Offer 1 (1).csv"),
+    ("fees 1", "FEES_PAID", "Fees_Paid_Iteration_1 (3).csv"),
+    ("iteration 2", "ITERATION_OFFER", "Iteration Offer 2.csv"),
+    ("fees 2", "FEES_PAID", "Fees_Paid_Iteration_2.csv"),
+]
+
+# Share of the last iteration's applicants in the generated withdrawal list.
+WITHDRAW_FRACTION = 0.01
+# Application numbers per /api/students/batch request.
+BATCH_SIZE = 500
+# Subject of the JWT cookie the benchmark client sends.
+BENCHMARK_USER = "benchmark@example.com"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def scaled_frame(df: pd.DataFrame, scale: int, rng):
+    """`scale` copies of a bundled file, app_nos suffixed per copy, rows shuffled."""
+    copies = [df]
+    for copy in range(1, scale):
+        part = df.copy()
+        part["app_no"] = part["app_no"] + f"-{copy}"
+        if "name" in part.columns:
+            part["name"] = rng.choice(df["name"].to_numpy(), len(part))
+        if "scholarship" in part.columns:
+            part["scholarship"] = part.groupby("offer")["scholarship"].transform(
+                lambda values: rng.choice(values.to_numpy(), len(values))
+            )
+        copies.append(part)
+    frame = pd.concat(copies, ignore_index=True)
+    return frame.iloc[rng.permutation(len(frame))].reset_index(drop=True)
+
+
+def generate_dataset(scale: int, seed: int = 0):
+    """
+    Writes the scaled flow files to SCRATCH_DIR. Returns [(step, table, path, rows)], sample
+    app_nos and names for the lookups, and the app_nos in the withdrawal list.
+    """
+    rng = np.random.default_rng(seed)
+    steps = []
+    frames = {}
+    for step, table_name, file_name in FLOW:
+        frame = scaled_frame(pd.read_csv(os.path.join(DATA_DIR, file_name), dtype=str), scale, rng)
+        path = os.path.join(SCRATCH_DIR, f"{step.replace(' ', '_')}.csv")
+        frame.to_csv(path, index=False)
+        steps.append((step, table_name, path, len(frame)))
+        frames[step] = frame
+
+    offered = frames["iteration 2"]["app_no"]
+    withdrawn = offered.sample(max(1, int(len(offered) * WITHDRAW_FRACTION)), random_state=seed)
+    path = os.path.join(SCRATCH_DIR, "withdraw.csv")
+    withdrawn.to_frame().to_csv(path, index=False)
+    steps.append(("withdrawals", "WITHDRAWS", path, len(withdrawn)))
+
+    # Lookups use applicants who have an offer from iteration 1 on, so every call should succeed.
+    first_offers = frames["iteration 1"]["app_no"]
+    app_nos = first_offers.sample(min(len(first_offers), 1000), random_state=seed).tolist()
+    names = frames["master"]["name"].sample(100, random_state=seed).tolist()
+    return steps, app_nos, names, set(withdrawn)
+
+
+class Benchmark:
+    def __init__(self, client: TestClient):
+        self.client = client
+        self.endpoints = {}
+        self.uploads = []
+
+    def call(self, label: str, method: str, url: str, **kwargs):
+        """Issues one request, recording its latency under `label` (an error if it is not 2xx)."""
+        stats = self.endpoints.setdefault(label, LatencyStats(window=100000))
+        started = time.perf_counter()
+        response = self.client.request(method, url, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            stats.record_error()
+            print(f"  {label}: HTTP {response.status_code} {response.text[:200]}")
+        else:
+            stats.record(elapsed_ms)
+        return response
+
+    def upload(self, step: str, table_name: str, path: str, rows: int):
+        url = "/api/withdraw/upload" if table_name == "WITHDRAWS" else f"/update/{table_name}"
+        label = "POST /api/withdraw/upload" if table_name == "WITHDRAWS" else f"POST /update/{table_name}"
+        started = time.perf_counter()
+        with open(path, "rb") as fileobj:
+            self.call(label, "POST", url, files={"file": (os.path.basename(path), fileobj, "text/csv")})
+        seconds = time.perf_counter() - started
+        self.uploads.append({
+            "step": step,
+            "table": table_name,
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows / seconds, 1) if seconds else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        })
+
+    def read_endpoints(self, repeats: int, iteration: int, app_nos: list, names: list, rng):
+        """The dashboard, lookup and listing reads, each issued `repeats` times."""
+        for _ in range(repeats):
+            app_no = str(rng.choice(app_nos))
+            self.call("GET /api/stats", "GET", "/api/stats")
+            self.call("GET /api/iteration-count", "GET", "/api/iteration-count")
+            self.call("GET /api/students?query=<app_no>", "GET", "/api/students", params={"query": app_no})
+            self.call("GET /api/students?query=<name>", "GET", "/api/students", params={"query": str(rng.choice(names))})
+            self.call("GET /api/fees?query=<app_no>", "GET", "/api/fees", params={"query": app_no})
+            self.call("GET /data/ITERATION_OFFER?limit=500", "GET", "/data/ITERATION_OFFER", params={"limit": 500})
+            if iteration:
+                self.call("GET /api/students/{app_no}/state", "GET", f"/api/students/{app_no}/state")
+                self.call("GET /api/iterations", "GET", "/api/iterations", params={"iteration": iteration})
+                self.call("GET /api/iterations/{n}/summary", "GET", f"/api/iterations/{iteration}/summary")
+                self.call("GET /api/fees/analytics", "GET", "/api/fees/analytics")
+                batch = [str(value) for value in rng.choice(app_nos, min(BATCH_SIZE, len(app_nos)), replace=False)]
+                self.call("POST /api/students/batch", "POST", "/api/students/batch", json={"app_nos": batch})
+        self.call("GET /export/ITERATION_OFFER", "GET", "/export/ITERATION_OFFER")
+
+    def report(self):
+        return {
+            "uploads": self.uploads,
+            "endpoints": {label: stats.to_dict() for label, stats in sorted(self.endpoints.items())},
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+
+
+def print_report(report: dict, scale: int, repeats: int):
+    print(f"\n== uploads (scale {scale}) ==")
+    print(f"{'step':<12} {'table':<16} {'rows':>9} {'MB':>7} {'seconds':>8} {'rows/s':>9} {'peak RSS MB':>12}")
+    for upload in report["uploads"]:
+        print(
+            f"{upload['step']:<12} {upload['table']:<16} {upload['rows']:>9} {upload['bytes'] / 1e6:>7.1f} "
+            f"{upload['seconds']:>8.2f} {upload['rows_per_second'] or 0:>9.0f} {upload['peak_rss_mb']:>12.1f}"
+        )
+    print(f"\n== endpoints ({repeats} calls per flow step) ==")
+    print(f"{'endpoint':<40} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label, stats in report["endpoints"].items():
+        print(
+            f"{label:<40} {stats['count']:>6} {stats['errors']:>6} {stats['p50_ms'] or 0:>9.2f} "
+            f"{stats['p95_ms'] or 0:>9.2f} {stats['p99_ms'] or 0:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+    print(f"\npeak RSS: {report['peak_rss_mb']:.1f} MB")
+
+
+def main(argv):
+    scale = int(argv[1]) if len(argv) > 1 else 1
+    repeats = int(argv[2]) if len(argv) > 2 else 20
+    report_path = argv[3] if len(argv) > 3 else None
+    try:
+        steps, app_nos, names, withdrawn = generate_dataset(scale)
+        rng = np.random.default_rng(1)
+
+        # Entering the client runs the app lifespan, i.e. the migrations.
+        with TestClient(app) as client:
+            # /export requires a login cookie.
+            client.cookies.set("token", create_access_token({"sub": BENCHMARK_USER}))
+            benchmark = Benchmark(client)
+            iteration = 0
+            for step, table_name, path, rows in steps:
+                print(f"{step}: uploading {rows} rows into {table_name}")
+                benchmark.upload(step, table_name, path, rows)
+                if step.startswith("iteration"):
+                    iteration = int(step.split()[1])
+                benchmark.read_endpoints(repeats, iteration, app_nos, names, rng)
+            for app_no in [app_no for app_no in app_nos if app_no not in withdrawn][:repeats]:
+                benchmark.call("POST /api/withdraw/student", "POST", "/api/withdraw/student", json={"app_no": app_no})
+
+        report = benchmark.report()
+        print_report(report, scale, repeats)
+        if report_path:
+            with open(report_path, "w") as fileobj:
+                json.dump({"scale": scale, "repeats": repeats, **report}, fileobj, indent=2)
+        return 0
+    finally:
+        engine.dispose()
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
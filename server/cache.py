@@ -0,0 +1,80 @@
+# cache.py
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after they are set."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# Callbacks run after a committed write changed one of the tables they watch.
+_listeners = defaultdict(list)
+
+
+def on_tables_changed(*table_names: str):
+    """Decorator registering a callback (e.g. a cache invalidation) for writes to the given tables."""
+    def register(callback):
+        for table_name in table_names:
+            _listeners[table_name.upper()].append(callback)
+        return callback
+    return register
+
+
+def tables_changed(*table_names: str):
+    """
+    Notifies the registered callbacks that the given tables were written.
+    Call it after the transaction has committed, so readers never re-cache old data.
+    """
+    callbacks = []
+    for table_name in table_names:
+        for callback in _listeners.get(table_name.upper(), []):
+            if callback not in callbacks:
+                callbacks.append(callback)
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Cache invalidation %s failed", getattr(callback, "__name__", callback))
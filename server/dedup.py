@@ -0,0 +1,116 @@
+# dedup.py
+"""
+Content hashing that makes re-uploads idempotent.
+
+Each upload gets a SHA-256 over its bytes and each row a 64-bit hash of its coerced values
+(pandas.util.hash_pandas_object, one vectorized pass per chunk). File hashes go to
+UPLOAD_HASHES and row hashes to ROW_HASHES, keyed by table and primary key. A file already
+ingested into the same table is skipped entirely, and otherwise only rows whose hash changed
+since the last upload are written. A row is compared with what was last uploaded for it, not
+with the table: a row re-sent unchanged is not rewritten even if it was edited in the database
+since (a withdrawal, say). Uploading with force=true writes every row.
+
+`context` is folded into both hashes when the effect of a row depends on more than its content.
+FEES_PAID passes the latest iteration and the version of ITERATION_OFFER (its latest upload),
+because fee statuses are recomputed against both: the same fees file uploaded after a new
+iteration or a corrected offers file is still processed.
+"""
+import hashlib
+from datetime import datetime
+import pandas as pd
+from sqlalchemy import select, and_
+from db import upload_hashes_table, row_hashes_table
+from ingest import upsert_statement
+from status import chunked
+from validation import key_strings
+
+# Bytes read at a time while hashing an upload.
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(fileobj, table_name: str, context=None):
+    """SHA-256 of the upload (plus table name and context) as hex. Leaves the file at position 0."""
+    digest = hashlib.sha256(f"{table_name}\x00{context}\x00".encode())
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def upload_seen(connection, table_obj, file_hash: str):
+    return connection.execute(
+        select(upload_hashes_table.c.file_hash).where(
+            and_(upload_hashes_table.c.table_name == table_obj.name, upload_hashes_table.c.file_hash == file_hash)
+        )
+    ).first() is not None
+
+
+def record_upload(connection, table_obj, file_hash: str, file_name: str, rows: int):
+    connection.execute(
+        upsert_statement(connection, upload_hashes_table),
+        [{"table_name": table_obj.name, "file_hash": file_hash, "file_name": file_name, "rows": rows, "upload_date": datetime.now()}],
+    )
+
+
+def table_version(connection, table_name: str):
+    """The latest upload recorded for a table as "<file hash>@<upload date>", or None."""
+    latest = connection.execute(
+        select(upload_hashes_table.c.file_hash, upload_hashes_table.c.upload_date)
+        .where(upload_hashes_table.c.table_name == table_name)
+        .order_by(upload_hashes_table.c.upload_date.desc())
+        .limit(1)
+    ).first()
+    return f"{latest.file_hash}@{latest.upload_date.isoformat()}" if latest else None
+
+
+def row_hashes(table_obj, df: pd.DataFrame, context=None):
+    """Hex content hash of every row of a coerced chunk, indexed by its primary key string."""
+    columns = [column.name for column in table_obj.columns]
+    frame = df[columns].assign(_context=str(context))
+    hashes = pd.util.hash_pandas_object(frame, index=False).map("{:016x}".format)
+    hashes.index = key_strings(df, [column.name for column in table_obj.primary_key])
+    return hashes
+
+
+def stored_row_hashes(connection, table_obj, keys: list):
+    """The ROW_HASHES entries of the given row keys, as a dict."""
+    stored = {}
+    for chunk in chunked(keys):
+        stored.update(
+            connection.execute(
+                select(row_hashes_table.c.row_key, row_hashes_table.c.row_hash).where(
+                    and_(row_hashes_table.c.table_name == table_obj.name, row_hashes_table.c.row_key.in_(chunk))
+                )
+            ).all()
+        )
+    return stored
+
+
+def changed_rows(connection, table_obj, df: pd.DataFrame, context=None, force: bool = False):
+    """
+    Splits a coerced chunk into the rows whose content changed since they were last uploaded.
+    Returns (changed rows, their hashes); `force` keeps every row. Tables without a primary key
+    are never deduplicated.
+    """
+    if not len(table_obj.primary_key.columns):
+        return df, None
+    hashes = row_hashes(table_obj, df, context)
+    if force:
+        return df, hashes
+    stored = stored_row_hashes(connection, table_obj, hashes.index.tolist())
+    changed = (hashes != pd.Series(stored, dtype=object).reindex(hashes.index)).to_numpy()
+    return df[changed], hashes[changed]
+
+
+def record_row_hashes(connection, table_obj, hashes: pd.Series):
+    """Upserts the hashes of rows that were just written, as one executemany of the cached upsert."""
+    if hashes is None or hashes.empty:
+        return
+    connection.execute(
+        upsert_statement(connection, row_hashes_table),
+        [
+            {"table_name": table_obj.name, "row_key": key, "row_hash": row_hash}
+            for key, row_hash in zip(hashes.index, hashes.to_numpy())
+        ],
+    )
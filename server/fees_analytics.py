@@ -0,0 +1,236 @@
+# fees_analytics.py
+"""
+Fee collection analytics over an in-memory, column-oriented copy of FEES_PAID.
+
+Each FEES_PAID row is joined with the applicant's latest ITERATION_OFFER row (the offer the
+fee statuses are derived against, see status.py), so every payment is counted exactly once,
+under the iteration and offer it was collected for. The frame is loaded once and group-bys
+run vectorized in pandas. Uploads mark the app_nos they touched as dirty; once the upload has
+committed only those rows are re-read before the next query. A full reload happens every FEES_FRAME_TTL seconds, which
+bounds staleness for writes made by other workers.
+"""
+import os
+import time
+import json
+import logging
+import threading
+from concurrent.futures import Future
+import pandas as pd
+from sqlalchemy import select, func, and_
+from db import fees_paid_table, iteration_offer_table
+from status import chunked
+from cache import on_tables_changed
+
+logger = logging.getLogger(__name__)
+
+FEES_FRAME_TTL = float(os.environ.get("FEES_FRAME_TTL", 600))
+
+FRAME_COLUMNS = [
+    "app_no",
+    "itr_no",
+    "offer",
+    "admission_fees_amount",
+    "admission_fees_status",
+    "admission_fees_paid_date",
+    "tution_fees_amount",
+    "tution_fees_status",
+    "tution_fees_paid_date",
+]
+GROUP_COLUMNS = ["itr_no", "offer"]
+
+
+def fees_rows_stmt(app_nos: list = None):
+    """FEES_PAID rows joined with each applicant's latest ITERATION_OFFER row, optionally for some app_nos."""
+    latest = select(
+        iteration_offer_table.c.app_no,
+        func.max(iteration_offer_table.c.itr_no).label("itr_no"),
+    ).group_by(iteration_offer_table.c.app_no)
+    if app_nos is not None:
+        latest = latest.where(iteration_offer_table.c.app_no.in_(app_nos))
+    latest = latest.subquery()
+
+    stmt = select(
+        fees_paid_table.c.app_no,
+        latest.c.itr_no,
+        iteration_offer_table.c.offer,
+        fees_paid_table.c.admission_fees_amount,
+        fees_paid_table.c.admission_fees_status,
+        fees_paid_table.c.admission_fees_paid_date,
+        fees_paid_table.c.tution_fees_amount,
+        fees_paid_table.c.tution_fees_status,
+        fees_paid_table.c.tution_fees_paid_date,
+    ).select_from(
+        fees_paid_table.outerjoin(latest, latest.c.app_no == fees_paid_table.c.app_no).outerjoin(
+            iteration_offer_table,
+            and_(
+                iteration_offer_table.c.app_no == latest.c.app_no,
+                iteration_offer_table.c.itr_no == latest.c.itr_no,
+            ),
+        )
+    )
+    if app_nos is not None:
+        stmt = stmt.where(fees_paid_table.c.app_no.in_(app_nos))
+    return stmt
+
+
+def prepare_frame(rows):
+    """Builds the analytics frame, precomputing the paid flags, collected amounts and payment days."""
+    frame = pd.DataFrame(rows, columns=FRAME_COLUMNS)
+    frame["itr_no"] = frame["itr_no"].astype("Int64")
+    for prefix, name in (("admission_fees", "admission"), ("tution_fees", "tuition")):
+        paid = pd.to_numeric(frame[f"{prefix}_status"], errors="coerce").fillna(0).astype(bool)
+        amount = pd.to_numeric(frame[f"{prefix}_amount"], errors="coerce").fillna(0)
+        frame[f"{name}_paid"] = paid
+        frame[f"{name}_collected"] = amount.where(paid, 0).astype("int64")
+        frame[f"{name}_day"] = pd.to_datetime(frame[f"{prefix}_paid_date"], errors="coerce").dt.normalize()
+    return frame
+
+
+def load_frame(connection, app_nos: list = None):
+    if app_nos is None:
+        return prepare_frame(connection.execute(fees_rows_stmt()).all())
+    rows = []
+    for chunk in chunked(list(app_nos)):
+        rows.extend(connection.execute(fees_rows_stmt(chunk)).all())
+    return prepare_frame(rows)
+
+
+class FeesFrame:
+    """The shared analytics frame with its dirty-app_no bookkeeping."""
+
+    def __init__(self, ttl: float = FEES_FRAME_TTL):
+        self.ttl = ttl
+        self._frame = None
+        self._loaded_at = 0.0
+        self._staged = set()
+        self._dirty = set()
+        # The load in flight, shared by every caller that needs the frame meanwhile.
+        self._loading = None
+        # Bumped by invalidate, so a load that raced with it is returned but not kept.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, app_nos):
+        """
+        Records app_nos whose FEES_PAID or ITERATION_OFFER rows are being written. They are only
+        re-read after publish_dirty, i.e. once the writing transaction has committed.
+        """
+        with self._lock:
+            self._staged.update(app_nos)
+
+    def publish_dirty(self):
+        with self._lock:
+            self._dirty.update(self._staged)
+            self._staged.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._frame = None
+            self._generation += 1
+
+    def ensure_fresh(self, bind):
+        """
+        Loads the frame if it is missing or older than the TTL, otherwise replaces the rows of the
+        dirty app_nos. Blocks on database I/O, so call it from a worker thread with the sync
+        engine: `await run_in_threadpool(fees_frame.ensure_fresh, engine)`.
+
+        The lock only guards the bookkeeping and the swap of the finished frame. One caller runs
+        the load; callers arriving meanwhile wait for its result.
+        """
+        with self._lock:
+            loading = self._loading
+            if loading is None:
+                full = self._frame is None or time.monotonic() - self._loaded_at > self.ttl
+                if not full and not self._dirty:
+                    return self._frame
+                frame, dirty, generation = self._frame, set(self._dirty), self._generation
+                self._loading = Future()
+        if loading is not None:
+            return loading.result()
+
+        loading = self._loading
+        started = time.perf_counter()
+        try:
+            with bind.connect() as connection:
+                if full:
+                    frame = load_frame(connection)
+                else:
+                    fresh = load_frame(connection, sorted(dirty))
+                    kept = frame[~frame["app_no"].isin(dirty)]
+                    frame = pd.concat([kept, fresh], ignore_index=True) if not fresh.empty else kept.reset_index(drop=True)
+        except BaseException as e:
+            with self._lock:
+                self._loading = None
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            if generation == self._generation:
+                self._frame = frame
+                if full:
+                    self._loaded_at = time.monotonic()
+                # App_nos published while the load ran stay dirty for the next call.
+                self._dirty -= dirty
+            self._loading = None
+        loading.set_result(frame)
+        if full:
+            logger.info("Loaded fees analytics frame with %s rows in %.1f ms", len(frame), (time.perf_counter() - started) * 1000)
+        else:
+            logger.info("Refreshed %s applicants in the fees analytics frame in %.1f ms", len(dirty), (time.perf_counter() - started) * 1000)
+        return frame
+
+
+fees_frame = FeesFrame()
+
+
+@on_tables_changed("FEES_PAID", "ITERATION_OFFER")
+def publish_fees_frame_changes():
+    fees_frame.publish_dirty()
+
+
+def collection_totals(frame: pd.DataFrame):
+    """Paid/unpaid counts and collected amounts per (itr_no, offer)."""
+    totals = frame.groupby(GROUP_COLUMNS, dropna=False).agg(
+        applicants=("app_no", "size"),
+        admission_paid=("admission_paid", "sum"),
+        admission_collected=("admission_collected", "sum"),
+        tuition_paid=("tuition_paid", "sum"),
+        tuition_collected=("tuition_collected", "sum"),
+    ).reset_index()
+    totals["admission_unpaid"] = totals["applicants"] - totals["admission_paid"]
+    totals["tuition_unpaid"] = totals["applicants"] - totals["tuition_paid"]
+    return totals
+
+
+def daily_collections(frame: pd.DataFrame):
+    """Payments and amounts collected per (itr_no, offer, day) for each fee."""
+    daily = []
+    for name in ("admission", "tuition"):
+        paid = frame[frame[f"{name}_paid"]]
+        daily.append(
+            paid.groupby([*GROUP_COLUMNS, f"{name}_day"], dropna=False)
+            .agg(**{f"{name}_payments": ("app_no", "size"), f"{name}_collected": (f"{name}_collected", "sum")})
+            .rename_axis([*GROUP_COLUMNS, "date"])
+        )
+    series = pd.concat(daily, axis=1).fillna(0).astype("int64").reset_index().sort_values(["date", *GROUP_COLUMNS])
+    series["date"] = series["date"].dt.strftime("%Y-%m-%d")
+    return series
+
+
+def to_records(frame: pd.DataFrame):
+    """JSON-safe records (NaN/NA -> None, numpy scalars -> Python numbers)."""
+    return json.loads(frame.to_json(orient="records"))
+
+
+def fees_analytics(frame: pd.DataFrame, itr_no: int = None, offer: str = None):
+    if itr_no is not None:
+        frame = frame[frame["itr_no"] == itr_no]
+    if offer is not None:
+        frame = frame[frame["offer"] == offer]
+    totals = collection_totals(frame)
+    overall = totals.drop(columns=GROUP_COLUMNS).sum()
+    return {
+        "totals": {key: int(value) for key, value in overall.items()},
+        "groups": to_records(totals),
+        "daily": to_records(daily_collections(frame)) if not frame.empty else [],
+    }
@@ -0,0 +1,171 @@
+# ingest.py
+import os
+import time
+import pickle
+import logging
+import tempfile
+from functools import lru_cache
+import pandas as pd
+from sqlalchemy import select, tuple_, DateTime
+from sqlalchemy.dialects import mysql, sqlite
+
+logger = logging.getLogger(__name__)
+
+# Number of rows sent per executemany of the INSERT ... ON DUPLICATE KEY UPDATE statement.
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 1000))
+
+# Number of CSV rows parsed into memory at a time when streaming an upload.
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 10000))
+
+
+def read_csv_chunks(fileobj, chunk_size: int = INGEST_CHUNK_SIZE):
+    """
+    Parses an uploaded CSV file object (e.g. UploadFile.file) as an iterator of DataFrames
+    of at most `chunk_size` rows, so the raw file and the full frame are never held at once.
+    """
+    fileobj.seek(0)
+    return pd.read_csv(fileobj, chunksize=chunk_size)
+
+
+class ChunkSpool:
+    """
+    Parsed DataFrame chunks written to an anonymous temporary file, so an upload is parsed once
+    for validation and its chunks replayed for writing without holding the whole file in memory.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+        self.chunks = 0
+
+    def append(self, df: pd.DataFrame):
+        pickle.dump(df, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.chunks += 1
+
+    def replay(self):
+        """Yields the chunks in order, once; the file is deleted when the iteration ends."""
+        try:
+            self._file.seek(0)
+            for _ in range(self.chunks):
+                yield pickle.load(self._file)
+        finally:
+            self.close()
+
+    def close(self):
+        self._file.close()
+
+
+def column_values(series: pd.Series, column=None):
+    """
+    Converts a DataFrame column into a plain Python list, with NaN replaced by None.
+    Text in DateTime columns is parsed so every dialect receives datetime objects.
+    """
+    if column is not None and isinstance(column.type, DateTime) and not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series)
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def upsert_statement(connection, table_obj):
+    """
+    The upsert statement for the table on the connection's dialect, without any values.
+
+    Execute it with a list of row dicts (`connection.execute(stmt, rows)`): the statement is
+    built once per table and dialect, so SQLAlchemy compiles it once and caches it, and the rows
+    go to the driver as one executemany (which pymysql sends as multi-row INSERTs).
+
+    MySQL gets INSERT ... ON DUPLICATE KEY UPDATE, SQLite (used for local runs)
+    gets INSERT ... ON CONFLICT DO UPDATE. Tables without a primary key get a plain INSERT.
+    """
+    return _upsert_statement(connection.dialect.name, table_obj)
+
+
+@lru_cache(maxsize=None)
+def _upsert_statement(dialect: str, table_obj):
+    primary_keys = [col.name for col in table_obj.primary_key]
+    update_columns = [col.name for col in table_obj.columns if col.name not in primary_keys]
+
+    if not primary_keys:
+        return table_obj.insert()
+
+    if dialect == "mysql":
+        stmt = mysql.insert(table_obj)
+        if not update_columns:
+            return stmt.prefix_with("IGNORE")
+        return stmt.on_duplicate_key_update({key: stmt.inserted[key] for key in update_columns})
+
+    if dialect == "sqlite":
+        stmt = sqlite.insert(table_obj)
+        if not update_columns:
+            return stmt.on_conflict_do_nothing(index_elements=primary_keys)
+        return stmt.on_conflict_do_update(
+            index_elements=primary_keys,
+            set_={key: stmt.excluded[key] for key in update_columns},
+        )
+
+    raise ValueError(f"Bulk upsert is not supported for the {dialect} dialect.")
+
+
+def existing_keys(connection, table_obj, keys: list):
+    """Returns the subset of the given primary key tuples that already exist in the table."""
+    pk_columns = list(table_obj.primary_key.columns)
+    if len(pk_columns) == 1:
+        result = connection.execute(
+            select(pk_columns[0]).where(pk_columns[0].in_([key[0] for key in keys]))
+        )
+    else:
+        result = connection.execute(
+            select(*pk_columns).where(tuple_(*pk_columns).in_(keys))
+        )
+    return {tuple(row) for row in result}
+
+
+def bulk_upsert(connection, table_obj, df: pd.DataFrame, batch_size: int = INGEST_BATCH_SIZE, batches: list = None):
+    """
+    Upserts every row of the DataFrame into the table in batches of executemany upserts.
+
+    The DataFrame is converted into per-column lists once; each batch then costs one
+    primary key lookup (to tell inserts from updates) and one executemany of the cached upsert.
+    Returns a list with rows inserted, rows updated and elapsed time for each batch.
+    Pass the list from a previous call as `batches` to keep numbering across CSV chunks.
+    """
+    columns = [col.name for col in table_obj.columns]
+    primary_keys = [col.name for col in table_obj.primary_key]
+    values = [column_values(df[column], table_obj.c[column]) for column in columns]
+
+    if batches is None:
+        batches = []
+    for start in range(0, len(df), batch_size):
+        started = time.perf_counter()
+        rows = [
+            dict(zip(columns, row))
+            for row in zip(*(column[start:start + batch_size] for column in values))
+        ]
+
+        updated = 0
+        if primary_keys:
+            keys = [tuple(row[key] for key in primary_keys) for row in rows]
+            found = existing_keys(connection, table_obj, keys)
+            updated = sum(1 for key in keys if key in found)
+
+        connection.execute(upsert_statement(connection, table_obj), rows)
+
+        batch = {
+            "batch": len(batches) + 1,
+            "rows": len(rows),
+            "inserted": len(rows) - updated,
+            "updated": updated,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        logger.info("Upserted batch %s into %s: %s", batch["batch"], table_obj.name, batch)
+        batches.append(batch)
+
+    return batches
+
+
+def summarize_batches(batches: list):
+    """Totals the per-batch counters returned by bulk_upsert."""
+    return {
+        "rows": sum(batch["rows"] for batch in batches),
+        "inserted": sum(batch["inserted"] for batch in batches),
+        "updated": sum(batch["updated"] for batch in batches),
+        "elapsed_ms": round(sum(batch["elapsed_ms"] for batch in batches), 2),
+    }
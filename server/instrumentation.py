@@ -0,0 +1,268 @@
+# instrumentation.py
+"""
+Per-request timing and database query accounting.
+
+RequestTimingMiddleware (added in main.py) opens a RequestStats for every request in a
+context variable. SQLAlchemy cursor hooks on both engines add each statement's count and time to it,
+keyed by a fingerprint: the SQL with literals replaced by ? and IN/VALUES lists collapsed.
+Repeated fingerprints within one request are the N+1 patterns. Statements run through
+AsyncSession, run_sync and run_in_threadpool share the request's context and are counted;
+background jobs run outside any request and only count towards the totals.
+
+Per-route latency histograms, query counts and DB time are exposed in the Prometheus text
+format at /metrics. Requests slower than SLOW_REQUEST_MS are logged with their most expensive
+fingerprints and kept in `slow_requests` for /api/internal/metrics.
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from sqlalchemy import event
+from db import engine, async_engine
+from metrics import LatencyStats, Histogram, histogram_lines, prometheus_labels
+
+logger = logging.getLogger(__name__)
+
+# Requests taking at least this long are logged with their statement fingerprints.
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+# Slow requests kept for /api/internal/metrics, and fingerprints listed per slow request.
+SLOW_REQUEST_HISTORY = int(os.environ.get("SLOW_REQUEST_HISTORY", 50))
+SLOW_REQUEST_STATEMENTS = 5
+# Longest fingerprint kept; long statements are cut off.
+FINGERPRINT_LENGTH = 200
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str):
+    """The statement with literals and placeholders as ? and IN/VALUES lists as (...)."""
+    text = _WHITESPACE.sub(" ", statement).strip()
+    text = _STRING_LITERAL.sub("?", text)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _LIST.sub("(...)", text)
+    return text[:FINGERPRINT_LENGTH]
+
+
+class RequestStats:
+    """Statements executed on behalf of one request: count and time per fingerprint."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float):
+        key = fingerprint(statement)
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+            count, total = self.statements.get(key, (0, 0.0))
+            self.statements[key] = (count + 1, total + seconds)
+
+    def top_statements(self, limit: int = SLOW_REQUEST_STATEMENTS):
+        with self._lock:
+            ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [{"statement": key, "count": count, "db_ms": round(total * 1000, 3)} for key, (count, total) in ranked]
+
+
+current_request = ContextVar("current_request", default=None)
+
+
+class RouteMetrics:
+    """Latency, status and database usage of one (method, route) pair."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.latency_stats = LatencyStats()
+        self.query_counts = Histogram(QUERY_COUNT_BUCKETS)
+        self.statuses = {}
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.routes = {}
+        self.slow_requests = deque(maxlen=SLOW_REQUEST_HISTORY)
+        self.queries = 0
+        self.db_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _route(self, method: str, route: str):
+        with self._lock:
+            metrics = self.routes.get((method, route))
+            if metrics is None:
+                metrics = self.routes[(method, route)] = RouteMetrics()
+            return metrics
+
+    def record_statement(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+    def record_request(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        metrics = self._route(method, route)
+        metrics.latency.observe(seconds)
+        metrics.latency_stats.record(seconds * 1000)
+        metrics.query_counts.observe(stats.queries)
+        with self._lock:
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.queries += stats.queries
+            metrics.db_seconds += stats.db_seconds
+
+        elapsed_ms = seconds * 1000
+        if elapsed_ms >= SLOW_REQUEST_MS:
+            top = stats.top_statements()
+            self.slow_requests.append({
+                "method": method,
+                "route": route,
+                "status": status,
+                "elapsed_ms": round(elapsed_ms, 3),
+                "queries": stats.queries,
+                "db_ms": round(stats.db_seconds * 1000, 3),
+                "statements": top,
+                "at": time.time(),
+            })
+            logger.warning(
+                "Slow request %s %s: %.1f ms, %s queries (%.1f ms in DB); top statements: %s",
+                method, route, elapsed_ms, stats.queries, stats.db_seconds * 1000,
+                "; ".join(f"{entry['count']}x {entry['db_ms']} ms {entry['statement']}" for entry in top),
+            )
+
+    def to_dict(self):
+        """Per-route latency percentiles and database usage for /api/internal/metrics."""
+        with self._lock:
+            routes = sorted(self.routes.items())
+        return {
+            "routes": {
+                f"{method} {route}": {
+                    **metrics.latency_stats.to_dict(),
+                    "statuses": dict(metrics.statuses),
+                    "queries": metrics.queries,
+                    "db_ms": round(metrics.db_seconds * 1000, 3),
+                }
+                for (method, route), metrics in routes
+            },
+            "slow_requests": list(self.slow_requests),
+        }
+
+    def prometheus(self):
+        """All request and database metrics in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self.routes.items())
+            queries, db_seconds = self.queries, self.db_seconds
+        lines = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), metrics in routes:
+            lines.extend(histogram_lines("http_request_duration_seconds", {"method": method, "route": route}, metrics.latency))
+        lines += ["# HELP http_requests_total Requests by route and status code.", "# TYPE http_requests_total counter"]
+        for (method, route), metrics in routes:
+            for status, count in sorted(metrics.statuses.items()):
+                lines.append(f"http_requests_total{prometheus_labels({'method': method, 'route': route, 'status': status})} {count}")
+        lines += [
+            "# HELP http_request_db_queries Database statements per request by route.",
+            "# TYPE http_request_db_queries histogram",
+        ]
+        for (method, route), metrics in routes:
+            lines.extend(histogram_lines("http_request_db_queries", {"method": method, "route": route}, metrics.query_counts))
+        lines += [
+            "# HELP http_request_db_seconds_total Time spent in database statements by route.",
+            "# TYPE http_request_db_seconds_total counter",
+        ]
+        for (method, route), metrics in routes:
+            lines.append(f"http_request_db_seconds_total{prometheus_labels({'method': method, 'route': route})} {metrics.db_seconds}")
+        lines += [
+            "# HELP db_queries_total Database statements executed, including background jobs.",
+            "# TYPE db_queries_total counter",
+            f"db_queries_total {queries}",
+            "# HELP db_seconds_total Time spent in database statements, including background jobs.",
+            "# TYPE db_seconds_total counter",
+            f"db_seconds_total {db_seconds}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+request_metrics = RequestMetrics()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    seconds = time.perf_counter() - started
+    request_metrics.record_statement(seconds)
+    stats = current_request.get()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+for instrumented in (engine, async_engine.sync_engine):
+    event.listen(instrumented, "before_cursor_execute", before_cursor_execute)
+    event.listen(instrumented, "after_cursor_execute", after_cursor_execute)
+
+
+def route_template(scope):
+    """The path template of the matched route (e.g. /export/{table_name}), so labels stay bounded."""
+    return getattr(scope.get("route"), "path", None) or "unmatched"
+
+
+class RequestTimingMiddleware:
+    """
+    ASGI middleware recording latency, status and database usage of every HTTP request.
+
+    A request is recorded once the last body message has been sent, not when the response
+    headers are ready, so the statements a StreamingResponse runs while producing its body
+    (/export, streamed /data) are counted and timed with it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                request_metrics.record_request(scope["method"], route_template(scope), status, time.perf_counter() - started, stats)
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            current_request.reset(token)
+            # Requests that failed or were cut off before their last body message.
+            record()
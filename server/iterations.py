@@ -0,0 +1,86 @@
+# iterations.py
+"""
+The current (latest) iteration, resolved once and shared by every route.
+
+The latest iteration is the ITERATION_DATE row with the newest date. It only changes when an
+ITERATION_OFFER upload writes ITERATION_DATE, so it is kept in memory and dropped from the
+tables_changed listener after such an upload commits. LATEST_ITERATION_TTL bounds staleness
+for writes made by other workers.
+"""
+import os
+import time
+import threading
+from sqlalchemy import select
+from db import iteration_date_table
+from cache import on_tables_changed
+
+LATEST_ITERATION_TTL = float(os.environ.get("LATEST_ITERATION_TTL", 60))
+
+_MISSING = object()
+
+
+def latest_iteration_stmt():
+    return (
+        select(iteration_date_table.c.iteration, iteration_date_table.c.date)
+        .order_by(iteration_date_table.c.date.desc())
+        .limit(1)
+    )
+
+
+class LatestIteration:
+    """
+    Cached (iteration, date) row of the current iteration, or None while ITERATION_DATE is empty.
+    `resolve` takes a sync connection or session, `resolve_async` an AsyncSession.
+    """
+
+    def __init__(self, ttl: float = LATEST_ITERATION_TTL):
+        self.ttl = ttl
+        self._value = _MISSING
+        self._expires_at = 0.0
+        # Bumped by invalidate, so a lookup that raced with a write never caches the old row.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _cached(self):
+        with self._lock:
+            if self._value is not _MISSING and time.monotonic() < self._expires_at:
+                return self._value, self._generation
+            return _MISSING, self._generation
+
+    def _store(self, value, generation: int):
+        with self._lock:
+            if generation == self._generation:
+                self._value = value
+                self._expires_at = time.monotonic() + self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._value = _MISSING
+            self._generation += 1
+
+    def resolve(self, connection):
+        value, generation = self._cached()
+        if value is _MISSING:
+            value = connection.execute(latest_iteration_stmt()).fetchone()
+            self._store(value, generation)
+        return value
+
+    async def resolve_async(self, session):
+        value, generation = self._cached()
+        if value is _MISSING:
+            value = (await session.execute(latest_iteration_stmt())).fetchone()
+            self._store(value, generation)
+        return value
+
+    def number(self, connection):
+        """The current iteration number, or None."""
+        value = self.resolve(connection)
+        return value.iteration if value is not None else None
+
+
+current_iteration = LatestIteration()
+
+
+@on_tables_changed("ITERATION_DATE")
+def invalidate_current_iteration():
+    current_iteration.invalidate()
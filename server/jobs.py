@@ -0,0 +1,114 @@
+# jobs.py
+import os
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Number of uploads processed concurrently in the background.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Finished jobs are kept this long so their progress can still be polled.
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 3600))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="ingest-job")
+_jobs = {}
+_lock = threading.Lock()
+
+
+class Job:
+    """Progress of one background ingestion job."""
+
+    def __init__(self, kind: str, file_name: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.file_name = file_name
+        self.phase = "queued"
+        self.rows_processed = 0
+        self.errors = []
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def set_phase(self, phase: str):
+        with self._lock:
+            self.phase = phase
+
+    def add_rows(self, count: int):
+        with self._lock:
+            self.rows_processed += count
+
+    def to_dict(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "file_name": self.file_name,
+                "phase": self.phase,
+                "rows_processed": self.rows_processed,
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_second": round(self.rows_processed / elapsed, 1) if elapsed else 0.0,
+                "errors": list(self.errors),
+                "result": self.result,
+            }
+
+
+def _run(job: Job, path: str, fn, args):
+    job.started_at = time.time()
+    job.set_phase("running")
+    try:
+        with open(path, "rb") as fileobj:
+            job.result = fn(fileobj, *args, job=job)
+        job.set_phase("done")
+    except HTTPException as e:
+        # Validation failures carry a structured per-row report; keep it as is.
+        job.errors.append(e.detail if isinstance(e.detail, dict) else str(e.detail))
+        job.set_phase("failed")
+    except Exception as e:
+        logger.exception("Background job %s (%s) failed", job.id, job.kind)
+        job.errors.append(str(e))
+        job.set_phase("failed")
+    finally:
+        job.finished_at = time.time()
+        os.remove(path)
+
+
+def _prune():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+        del _jobs[job_id]
+
+
+def submit(kind: str, upload, fn, *args):
+    """
+    Queues `fn(fileobj, *args, job=job)` on the job pool and returns the Job right away.
+
+    The UploadFile is copied to a temporary file first, because FastAPI closes it as soon
+    as the request that received it has been answered.
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, tmp)
+
+    job = Job(kind, upload.filename)
+    with _lock:
+        _prune()
+        _jobs[job.id] = job
+    _executor.submit(_run, job, tmp.name, fn, args)
+    logger.info("Queued background job %s (%s) for %s", job.id, kind, upload.filename)
+    return job
+
+
+def get_job(job_id: str):
+    """Returns the job with the given id, or None if it is unknown or has expired."""
+    with _lock:
+        return _jobs.get(job_id)
@@ -1,14 +1,30 @@
 # main.py
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
+import migrations
+from instrumentation import RequestTimingMiddleware
 
-from routes import auth_routes, data_routes,stats_routes
+from routes import auth_routes, data_routes,stats_routes, job_routes, export_routes, metrics_routes, batch_routes
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bring the schema up to date before serving requests (RUN_MIGRATIONS=0 to skip).
+    if os.environ.get("RUN_MIGRATIONS", "1") == "1":
+        applied = migrations.upgrade()
+        if applied:
+            logger.info("Applied schema migrations: %s", applied)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+# Per-route latency histograms and per-request query counts/DB time (see instrumentation.py).
+app.add_middleware(RequestTimingMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,7 +37,12 @@ app.add_middleware(
 # Include routers under appropriate prefixes
 app.include_router(auth_routes.router, prefix="/api")
 app.include_router(data_routes.router)
+app.include_router(export_routes.router)
 app.include_router(stats_routes.router, prefix="/api") 
+app.include_router(batch_routes.router, prefix="/api")
+app.include_router(job_routes.router, prefix="/api")
+app.include_router(metrics_routes.router, prefix="/api")
+app.include_router(metrics_routes.prometheus_router)
 
 if __name__ == "__main__":
     import uvicorn
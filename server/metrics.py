@@ -0,0 +1,116 @@
+# metrics.py
+import time
+import bisect
+import threading
+from collections import deque
+
+# Upper bounds (seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyStats:
+    """Thread-safe running count/total/max of a latency, with percentiles over the last `window` samples."""
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ms: float):
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self._recent.append(elapsed_ms)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def timer(self):
+        """Context manager recording the time spent inside it (an exception counts as an error)."""
+        return _Timer(self)
+
+    def to_dict(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            count, errors, total_ms, max_ms = self.count, self.errors, self.total_ms, self.max_ms
+
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 3) if recent else None
+
+        return {
+            "count": count,
+            "errors": errors,
+            "avg_ms": round(total_ms / count, 3) if count else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(max_ms, 3),
+        }
+
+
+class _Timer:
+    def __init__(self, stats: LatencyStats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.stats.record((time.perf_counter() - self.started) * 1000)
+        else:
+            self.stats.record_error()
+        return False
+
+
+class Histogram:
+    """Thread-safe cumulative histogram in the Prometheus model: bucket counts, sum and count."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """(cumulative counts per bucket bound, including +Inf), sum and count."""
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bound, bucket_count in zip([*self.buckets, float("inf")], counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+def prometheus_labels(labels: dict):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def prometheus_bound(bound: float):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def histogram_lines(name: str, labels: dict, histogram: Histogram):
+    """Text exposition lines (_bucket, _sum, _count) of one labelled histogram."""
+    cumulative, total, count = histogram.snapshot()
+    lines = [f"{name}_bucket{prometheus_labels({**labels, 'le': prometheus_bound(bound)})} {running}" for bound, running in cumulative]
+    lines.append(f"{name}_sum{prometheus_labels(labels)} {total}")
+    lines.append(f"{name}_count{prometheus_labels(labels)} {count}")
+    return lines
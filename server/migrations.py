@@ -0,0 +1,114 @@
+# migrations.py
+"""
+Versioned schema migrations.
+
+metadata.create_all in db.py only creates missing tables, so anything that changes an
+existing table (indexes, new columns, backfills) is added here as a numbered migration.
+Applied versions are recorded in SCHEMA_VERSION. Migrations run on application startup
+(set RUN_MIGRATIONS=0 to disable) or from the command line:
+
+    python migrations.py upgrade     # apply pending migrations
+    python migrations.py status      # show applied and pending migrations
+"""
+import sys
+import logging
+from datetime import datetime
+from sqlalchemy import select, inspect, text
+from sqlalchemy.schema import CreateColumn
+from db import (
+    engine,
+    schema_version_table,
+    logs_table,
+    iteration_offer_itr_no_status_index,
+    iteration_offer_status_app_no_index,
+    iteration_date_date_index,
+    master_table_name_index,
+)
+from summary import rebuild_iteration_summary
+from applicant_state import rebuild_applicant_state
+
+logger = logging.getLogger(__name__)
+
+
+def create_indexes(connection, *indexes):
+    for index in indexes:
+        index.create(connection, checkfirst=True)
+
+
+def add_hot_path_indexes(connection):
+    create_indexes(
+        connection,
+        iteration_offer_itr_no_status_index,
+        iteration_offer_status_app_no_index,
+        iteration_date_date_index,
+        master_table_name_index,
+    )
+
+
+def add_upload_audit_columns(connection):
+    """Adds the per-upload metrics columns to LOGS_TABLE and widens its name columns (SQLite does not enforce lengths)."""
+    table = logs_table.name
+    existing = {column["name"] for column in inspect(connection).get_columns(table)}
+    for name in ("rows", "bytes", "duration_ms"):
+        if name not in existing:
+            column = CreateColumn(logs_table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}"))
+    if connection.dialect.name == "mysql":
+        for name in ("file_name", "uploaded_by"):
+            column = CreateColumn(logs_table.c[name]).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table} MODIFY {column}"))
+
+
+# (version, description, function taking a connection), in the order they must be applied.
+MIGRATIONS = [
+    (1, "Secondary indexes for iteration, status, iteration date and name lookups", add_hot_path_indexes),
+    (2, "Backfill ITERATION_SUMMARY from ITERATION_OFFER", rebuild_iteration_summary),
+    (3, "Upload metrics columns and wider file/user names on LOGS_TABLE", add_upload_audit_columns),
+    (4, "Backfill APPLICANT_STATE from ITERATION_OFFER, FEES_PAID and WITHDRAWS", rebuild_applicant_state),
+]
+
+
+def applied_versions(connection):
+    return set(connection.execute(select(schema_version_table.c.version)).scalars())
+
+
+def upgrade(bind=engine):
+    """Applies every pending migration in order. Returns the versions applied."""
+    applied = []
+    with bind.begin() as connection:
+        done = applied_versions(connection)
+        for version, description, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("Applying migration %s: %s", version, description)
+            migrate(connection)
+            connection.execute(
+                schema_version_table.insert().values(version=version, description=description, applied_at=datetime.now())
+            )
+            applied.append(version)
+    return applied
+
+
+def status(bind=engine):
+    with bind.connect() as connection:
+        done = applied_versions(connection)
+    return [(version, description, version in done) for version, description, _ in MIGRATIONS]
+
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else "upgrade"
+    if command == "upgrade":
+        applied = upgrade()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
+    elif command == "status":
+        for version, description, done in status():
+            print(f"{version:>4}  {'applied' if done else 'pending':<8} {description}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main(sys.argv))
@@ -0,0 +1,127 @@
+# query_plans.py
+"""
+Shows what the secondary indexes from migrations.py do for the hot queries.
+
+Loads the bundled CSVs into a scratch database without the migration indexes, prints the
+query plan and median latency of each hot query, applies the migrations and prints both
+again. Always runs on a private in-memory SQLite database: DATABASE_URL is ignored, so the
+configured database is never touched (the scratch tables are dropped and recreated).
+
+Usage (from the server directory):
+    python query_plans.py [repeats]
+"""
+import os
+import sys
+import time
+import statistics
+
+# db.py creates its engines (and tables) on import; keep them off the configured database too.
+os.environ["DATABASE_URL"] = "sqlite://"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import pandas as pd
+from sqlalchemy import create_engine, select, func, text
+from sqlalchemy.pool import StaticPool
+from db import (
+    metadata,
+    master_table,
+    iteration_offer_table,
+    iteration_date_table,
+    user_table,
+    schema_version_table,
+)
+from ingest import bulk_upsert
+from status import ACCEPTED_STATUSES
+import migrations
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DATASETS = [
+    ("MASTER_TABLE", "MasterFile.csv"),
+    ("ITERATION_OFFER", "Iteration Offer 1 (1).csv"),
+    ("ITERATION_OFFER", "Iteration Offer 2.csv"),
+]
+
+HOT_QUERIES = [
+    (
+        "iteration details (/api/iterations)",
+        select(iteration_offer_table.c.app_no, iteration_offer_table.c.offer, iteration_offer_table.c.status)
+        .where(iteration_offer_table.c.itr_no == 2),
+    ),
+    (
+        "accepted students (/api/stats)",
+        select(func.count(func.distinct(iteration_offer_table.c.app_no)))
+        .where(iteration_offer_table.c.status.in_(ACCEPTED_STATUSES)),
+    ),
+    (
+        "iteration summary by status",
+        select(iteration_offer_table.c.status, func.count())
+        .where(iteration_offer_table.c.itr_no == 2)
+        .group_by(iteration_offer_table.c.status),
+    ),
+    (
+        "latest iteration (ITERATION_DATE)",
+        select(iteration_date_table).order_by(iteration_date_table.c.date.desc()).limit(1),
+    ),
+    (
+        "name lookup (MASTER_TABLE)",
+        select(master_table).where(master_table.c.name == "Keith Brown"),
+    ),
+    (
+        "applicant latest iteration",
+        select(iteration_offer_table.c.itr_no)
+        .where(iteration_offer_table.c.app_no == "APP00513")
+        .order_by(iteration_offer_table.c.itr_no.desc())
+        .limit(1),
+    ),
+    (
+        "login (USERS.email)",
+        select(user_table).where(user_table.c.email == "admin@example.com"),
+    ),
+]
+
+
+def explain(connection, stmt):
+    sql = str(stmt.compile(connection.engine, compile_kwargs={"literal_binds": True}))
+    return "; ".join(row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql)))
+
+
+def median_ms(connection, stmt, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        connection.execute(stmt).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def report(engine, label, repeats):
+    print(f"\n== {label} ==")
+    with engine.connect() as connection:
+        for name, stmt in HOT_QUERIES:
+            print(f"{name:<40} {median_ms(connection, stmt, repeats):8.3f} ms  {explain(connection, stmt)}")
+
+
+def main(argv):
+    repeats = int(argv[1]) if len(argv) > 1 else 20
+    # StaticPool keeps the one in-memory database alive across connections.
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        for index in (index for table in metadata.tables.values() for index in table.indexes):
+            if not index.unique:
+                index.drop(connection, checkfirst=True)
+        connection.execute(schema_version_table.delete())
+        for table_name, file_name in DATASETS:
+            bulk_upsert(connection, metadata.tables[table_name], pd.read_csv(os.path.join(DATA_DIR, file_name)))
+
+    report(engine, "without secondary indexes", repeats)
+    migrations.upgrade(engine)
+    report(engine, "after migrations", repeats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
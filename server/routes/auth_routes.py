@@ -1,29 +1,56 @@
 from fastapi import APIRouter, Request, Response, HTTPException, Depends, Cookie
+import os
+import time
 import logging
 from fastapi.responses import JSONResponse
 from sqlalchemy import select
-from db import user_table, engine
-from auth import create_access_token, get_password_hash, verify_password, SECRET_KEY, ALGORITHM
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import user_table, get_db, db_session
+from cache import TTLCache, on_tables_changed, tables_changed
+from auth import create_access_token, hash_password, verify_and_update_password, SECRET_KEY, ALGORITHM
 import jwt
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Decoded payloads of recently validated tokens, keyed by the whole token string, so repeat
+# requests skip the HMAC check. An entry never outlives the token's own expiry.
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 4096))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+# /user responses keyed by email; cleared whenever USERS is written (e.g. on register).
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 300))
+user_cache = TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+
+
+@on_tables_changed("USERS")
+def invalidate_user_cache():
+    user_cache.clear()
+
 
 async def validate_token(token: str = Cookie(None)):
     """Validate JWT token on every request."""
     if not token:
         raise HTTPException(status_code=401, detail="Unauthorized")
+    payload = token_cache.get(token)
+    if payload is not None:
+        return dict(payload)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    ttl = TOKEN_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, payload, ttl=ttl)
+    return dict(payload)
 
 @router.post("/register")
-async def register_user(request: Request, response: Response):
+async def register_user(request: Request, response: Response, session: AsyncSession = Depends(get_db)):
     """
     Register a new user.
     
@@ -46,7 +73,6 @@ async def register_user(request: Request, response: Response):
         
         # Validate all required fields
         required_fields = [name, email, contact, campus, password, confirm_password]
-        print(required_fields)
         if not all(required_fields):
             raise HTTPException(status_code=400, detail="All fields are required.")
         
@@ -56,27 +82,27 @@ async def register_user(request: Request, response: Response):
         if campus not in ["Pilani", "Goa", "Hyderabad"]:
             raise HTTPException(status_code=400, detail="Invalid campus selection.")
 
-        with engine.connect() as connection:
-            # Check if email already exists
-            existing_user = connection.execute(
-                select(user_table).where(user_table.c.email == email)
-            ).fetchone()
-            if existing_user:
-                raise HTTPException(status_code=400, detail="User already exists.")
+        # Check if email already exists
+        existing_user = (await session.execute(
+            select(user_table).where(user_table.c.email == email)
+        )).fetchone()
+        if existing_user:
+            raise HTTPException(status_code=400, detail="User already exists.")
 
-        hashed_password = get_password_hash(password)
+        hashed_password = await hash_password(password)
         
-        with engine.begin() as connection:
-            # Insert new user with all fields
-            connection.execute(
-                user_table.insert().values(
-                    name=name,
-                    email=email,
-                    contact=contact,
-                    campus=campus,
-                    hashed_password=hashed_password
-                )
+        # Insert new user with all fields
+        await session.execute(
+            user_table.insert().values(
+                name=name,
+                email=email,
+                contact=contact,
+                campus=campus,
+                hashed_password=hashed_password
             )
+        )
+        await session.commit()
+        tables_changed("USERS")
 
         access_token = create_access_token({"sub": email})
         response.set_cookie(
@@ -89,12 +115,14 @@ async def register_user(request: Request, response: Response):
         )
         return {"token": access_token, "message": "User registered successfully."}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error during registration for email: %s", data.get("email", ""))
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/login")
-async def login_user(request: Request, response: Response):
+async def login_user(request: Request, response: Response, session: AsyncSession = Depends(get_db)):
     """
     Log in an existing user.
     
@@ -102,9 +130,7 @@ async def login_user(request: Request, response: Response):
     - email
     - password
     """
-    user_ip = request.client.host
-    
-    print("ip_address - ",user_ip)
+    logger.debug("Login request from %s", request.client.host if request.client else None)
     try:
         data = await request.json()
         email = data.get("email")
@@ -114,19 +140,27 @@ async def login_user(request: Request, response: Response):
         if not email or not password:
             raise HTTPException(status_code=400, detail="Email and password required.")
         
-        with engine.connect() as connection:
-            user = connection.execute(
-                select(user_table).where(user_table.c.email == email)
-            ).mappings().fetchone()
-            
-            if not user:
-                logger.info("User not found for email: %s", email)
-                raise HTTPException(status_code=400, detail="Invalid email or password.")
-            
-            hashed_password = user["hashed_password"]
-            if not verify_password(password, hashed_password):
-                logger.info("Password verification failed for email: %s", email)
-                raise HTTPException(status_code=400, detail="Invalid email or password.")
+        user = (await session.execute(
+            select(user_table).where(user_table.c.email == email)
+        )).mappings().fetchone()
+        
+        if not user:
+            logger.info("User not found for email: %s", email)
+            raise HTTPException(status_code=400, detail="Invalid email or password.")
+        
+        hashed_password = user["hashed_password"]
+        valid, new_hash = await verify_and_update_password(password, hashed_password)
+        if not valid:
+            logger.info("Password verification failed for email: %s", email)
+            raise HTTPException(status_code=400, detail="Invalid email or password.")
+
+        # Re-hash with the current bcrypt settings while we have the plain password.
+        if new_hash:
+            await session.execute(
+                user_table.update().where(user_table.c.email == email).values(hashed_password=new_hash)
+            )
+            await session.commit()
+            logger.info("Upgraded password hash for email: %s", email)
         
         # Create a JWT access token
         access_token = create_access_token({"sub": email})
@@ -167,17 +201,45 @@ async def logout_user(response: Response):
 async def get_user(payload: dict = Depends(validate_token)):
     """
     Returns the name of the user currently logged in.
-    The token is validated using the 'validate_token' dependency.
+    The token is validated using the 'validate_token' dependency, and the profile is served
+    from user_cache when possible, so repeat calls need neither crypto nor a database query.
     """
     email = payload.get("sub")
     if not email:
         raise HTTPException(status_code=401, detail="Invalid token payload.")
-    
+
+    profile = await user_profile(email)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found.")
+    return profile
+
+
+async def user_profile(email: str):
+    """The cached {"name": ...} profile of a user, or None if there is no such user."""
+    profile = user_cache.get(email)
+    if profile is not None:
+        return profile
+
     # Retrieve user info from the database.
-    with engine.connect() as connection:
-        user = connection.execute(
+    async with db_session() as session:
+        user = (await session.execute(
             select(user_table).where(user_table.c.email == email)
-        ).mappings().fetchone()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found.")
-        return {"name": user["name"]}
+        )).mappings().fetchone()
+    if not user:
+        return None
+    profile = {"name": user["name"]}
+    user_cache.set(email, profile)
+    return profile
+
+
+async def current_user_name(token: str = Cookie(None)):
+    """
+    Name of the logged-in user for audit entries, or None when the request carries no valid
+    token. Unlike validate_token it never rejects the request.
+    """
+    try:
+        payload = await validate_token(token)
+    except HTTPException:
+        return None
+    profile = await user_profile(payload["sub"]) if payload.get("sub") else None
+    return profile["name"] if profile else None
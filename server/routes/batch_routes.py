@@ -0,0 +1,134 @@
+# routes/batch_routes.py
+import os
+import json
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db, master_table, iteration_offer_table, fees_paid_table
+from ingest import read_csv_chunks
+from status import chunked
+
+router = APIRouter()
+
+# Largest number of distinct app_nos accepted by one batch request.
+BATCH_MAX_APP_NOS = int(os.environ.get("BATCH_MAX_APP_NOS", 10000))
+
+
+async def batch_app_nos(request: Request):
+    """
+    Reads the app_nos of a batch request, either as JSON ({"app_nos": [...]} or a bare list) or
+    as a multipart upload of a CSV file with an 'app_no' column (form field 'file').
+    Returns them de-duplicated, in request order.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or not hasattr(upload, "file"):
+            raise HTTPException(status_code=400, detail="Upload a CSV file in the 'file' field.")
+        values = []
+        for chunk_no, df in enumerate(read_csv_chunks(upload.file)):
+            if chunk_no == 0 and "app_no" not in df.columns:
+                raise HTTPException(status_code=400, detail="CSV must contain 'app_no' column")
+            values.extend(df["app_no"].dropna().tolist())
+    else:
+        try:
+            body = await request.json()
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Send a JSON list of app_nos or a CSV file.")
+        values = body.get("app_nos") if isinstance(body, dict) else body
+        if not isinstance(values, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON body like {\"app_nos\": [...]}.")
+
+    app_nos = list(dict.fromkeys(str(value).strip() for value in values if str(value).strip()))
+    if not app_nos:
+        raise HTTPException(status_code=400, detail="No application numbers given.")
+    if len(app_nos) > BATCH_MAX_APP_NOS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_APP_NOS} application numbers per request.")
+    return app_nos
+
+
+async def fetch_chunked(session: AsyncSession, stmt, key_column, app_nos: list):
+    """
+    Runs `stmt` once per chunk of app_nos with `key_column IN (...)` added. The app_nos are
+    chunked in sorted order, so rows ordered by the key stay ordered across chunks.
+    """
+    rows = []
+    for chunk in chunked(sorted(app_nos)):
+        rows.extend((await session.execute(stmt.where(key_column.in_(chunk)))).all())
+    return rows
+
+
+def columnar(columns: list, rows: list):
+    """Turns row tuples into {"columns": [...], "data": {column: [values...]}}."""
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return {
+        "columns": columns,
+        "data": {column: jsonable_encoder(list(column_values)) for column, column_values in zip(columns, values)},
+    }
+
+
+@router.post("/fees/batch")
+async def get_fees_batch(request: Request, session: AsyncSession = Depends(get_db)):
+    """
+    FEES_PAID records for a list of application numbers, sent as JSON or as a CSV upload.
+
+    Reads with one IN (...) query per chunk of app_nos and answers column-wise:
+      {"count": n, "missing": [...], "columns": [...], "data": {"app_no": [...], ...}}
+    where `missing` lists the app_nos that have no fees record.
+    """
+    try:
+        app_nos = await batch_app_nos(request)
+        stmt = select(fees_paid_table).order_by(fees_paid_table.c.app_no)
+        rows = await fetch_chunked(session, stmt, fees_paid_table.c.app_no, app_nos)
+
+        found = {row.app_no for row in rows}
+        return {
+            "count": len(rows),
+            "missing": [app_no for app_no in app_nos if app_no not in found],
+            **columnar(list(fees_paid_table.columns.keys()), rows),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/students/batch")
+async def get_students_batch(request: Request, session: AsyncSession = Depends(get_db)):
+    """
+    Name and full iteration history (itr_no, offer, scholarship, status) for a list of
+    application numbers, sent as JSON or as a CSV upload.
+
+    Reads with one IN (...) query per chunk of app_nos and answers column-wise, one entry per
+    (app_no, itr_no), ordered by app_no and iteration. Applicants without offers get a single
+    entry with null iteration fields; app_nos not in MASTER_TABLE are listed in `missing`.
+    """
+    try:
+        app_nos = await batch_app_nos(request)
+        stmt = (
+            select(
+                master_table.c.app_no,
+                master_table.c.name,
+                iteration_offer_table.c.itr_no,
+                iteration_offer_table.c.offer,
+                iteration_offer_table.c.scholarship,
+                iteration_offer_table.c.status,
+            )
+            .select_from(master_table)
+            .outerjoin(iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no)
+            .order_by(master_table.c.app_no, iteration_offer_table.c.itr_no)
+        )
+        rows = await fetch_chunked(session, stmt, master_table.c.app_no, app_nos)
+
+        found = {row.app_no for row in rows}
+        return {
+            "count": len(rows),
+            "missing": [app_no for app_no in app_nos if app_no not in found],
+            **columnar(["app_no", "name", "itr_no", "offer", "scholarship", "status"], rows),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,186 +1,331 @@
 # routes/data_routes.py
-from fastapi import APIRouter, HTTPException, UploadFile ,Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, HTTPException, UploadFile ,Request, Query, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
-import pandas as pd
-import io
-import requests
-from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+import json
+import base64
+from decimal import Decimal
+from datetime import datetime, date
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.dialects.mysql import insert
-from sqlalchemy import and_
 import logging
-import numpy as np
 from db import (
-    master_table,
-    iteration_offer_table,
-    fees_paid_table,
     iteration_date_table,
-    withdraws_table,
     logs_table,
     engine,
+    async_engine,
+    get_db,
     metadata
 )
+from ingest import bulk_upsert, read_csv_chunks, summarize_batches, upsert_statement, ChunkSpool, INGEST_BATCH_SIZE, INGEST_CHUNK_SIZE
+from status import recompute_fee_statuses, reconcile_upgrades
+from summary import refresh_iteration_summary
+from applicant_state import refresh_applicant_state
+from validation import ValidationReport, validate_chunk, validate_keys, FIRST_DATA_LINE
+from dedup import file_digest, upload_seen, record_upload, changed_rows, record_row_hashes, table_version
+from audit import UploadAudit, file_size, write_audit, write_failed_audit
+from routes.auth_routes import current_user_name
+from fees_analytics import fees_frame
+from iterations import current_iteration
+from cache import tables_changed
+import jobs
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-def clean_nan_values(row: dict):
-    """Replaces NaN values with None (so they can be stored as NULL in MySQL)."""
-    return {key: (None if pd.isna(value) else value) for key, value in row.items()}
+# Rows fetched from the server-side cursor per round trip when streaming a table.
+STREAM_BATCH_SIZE = 1000
+
+
+def json_default(value):
+    """json.dumps fallback matching jsonable_encoder for the column types used in db.py."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_cursor(values: list):
+    """Encodes the primary key values of the last row of a page as an opaque `after` cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values, default=json_default).encode()).decode()
+
+
+def decode_cursor(cursor: str, width: int):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != width:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
+
+
+async def stream_rows(stmt, fmt: str):
+    """
+    Yields the rows of `stmt` as NDJSON lines or as an incrementally written JSON array,
+    reading from a server-side cursor so only STREAM_BATCH_SIZE rows are held at a time.
+    """
+    async with async_engine.connect() as connection:
+        result = await connection.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        if fmt == "json":
+            yield '{"data": ['
+        first = True
+        async for rows in result.mappings().partitions():
+            lines = [json.dumps(dict(row), default=json_default) for row in rows]
+            if fmt == "ndjson":
+                yield "\n".join(lines) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(lines)
+            first = False
+        if fmt == "json":
+            yield "]}"
+
 
 @router.get("/data/{table_name}")
-async def read_data(table_name: str):
+async def read_data(
+    table_name: str,
+    session: AsyncSession = Depends(get_db),
+    limit: int = Query(None, gt=0, description="Page size; enables keyset pagination on the primary key"),
+    after: str = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    stream: str = Query(None, pattern="^(ndjson|json)$", description="Stream rows as NDJSON or a JSON array"),
+):
+    """
+    Returns the rows of a table.
+
+    - Without parameters the whole table is returned as {"data": [...]}.
+    - With `limit` (and `after`) the table is paged in primary key order and the response
+      carries `next_cursor`, or null on the last page.
+    - With `stream=ndjson|json` rows are streamed from a server-side cursor.
+    """
     try:
         table_obj = metadata.tables.get(table_name)
         if table_obj is None:
             raise HTTPException(status_code=400, detail=f"Table {table_name} does not exist.")
-        with engine.connect() as connection:
-            result = connection.execute(table_obj.select())
-            data = [jsonable_encoder(dict(row._mapping)) for row in result]
-            
-        return JSONResponse(content={"data": data}, status_code=200)
+
+        pk_columns = list(table_obj.primary_key.columns)
+        stmt = table_obj.select()
+        if limit is not None or after is not None:
+            if not pk_columns:
+                raise HTTPException(status_code=400, detail=f"Table {table_name} has no primary key to paginate on.")
+            stmt = stmt.order_by(*pk_columns)
+            if after is not None:
+                values = decode_cursor(after, len(pk_columns))
+                if len(pk_columns) == 1:
+                    stmt = stmt.where(pk_columns[0] > values[0])
+                else:
+                    stmt = stmt.where(tuple_(*pk_columns) > tuple_(*values))
+            if limit is not None:
+                stmt = stmt.limit(limit)
+
+        if stream is not None:
+            media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+            return StreamingResponse(stream_rows(stmt, stream), media_type=media_type)
+
+        result = await session.execute(stmt)
+        data = [jsonable_encoder(dict(row._mapping)) for row in result]
+
+        if limit is None:
+            return JSONResponse(content={"data": data}, status_code=200)
+
+        next_cursor = None
+        if len(data) == limit:
+            next_cursor = encode_cursor([data[-1][col.name] for col in pk_columns])
+        return JSONResponse(content={"data": data, "next_cursor": next_cursor}, status_code=200)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error reading data from table %s", table_name)
         raise HTTPException(status_code=500, detail=str(e))
 
+def ingest_csv_rows(connection, fileobj, table_obj, batch_size: int = INGEST_BATCH_SIZE, chunk_size: int = INGEST_CHUNK_SIZE, job=None, file_name: str = None, force: bool = False, audit: UploadAudit = None):
+    """
+    Streams a CSV file into `table_obj` and recomputes the affected ITERATION_OFFER statuses,
+    using the caller's (sync) connection and transaction. Background jobs pass their Job to
+    receive progress updates. Returns the upload summary.
+
+    A file identical to an earlier upload into the same table is skipped entirely: it is not
+    parsed, and no rows, iteration date or statuses are written. Otherwise only rows whose content
+    changed since they were last uploaded are written and recomputed (see dedup.py), so a row
+    re-sent unchanged keeps any edit made to it in the database since, such as a withdrawal's
+    ITERATION_OFFER status. `force` writes and recomputes every row regardless, as a first upload
+    does. The upload's LOGS_TABLE entry is written in the same transaction when an `audit` is given.
+    """
+    table_columns = set(table_obj.columns.keys())
+    upper_table = table_obj.name.upper()
+    latest_iteration = None
+
+    # Fee statuses are derived against the latest iteration and the offers, so both are part of
+    # what makes a fees upload "unchanged".
+    hash_context = None
+    if upper_table == "FEES_PAID":
+        latest_iteration = current_iteration.number(connection)
+        hash_context = f"{latest_iteration}:{table_version(connection, 'ITERATION_OFFER')}"
+
+    if audit:
+        audit.bytes = file_size(fileobj)
+    file_hash = file_digest(fileobj, table_obj.name, hash_context)
+    if not force and upload_seen(connection, table_obj, file_hash):
+        logger.info("Skipping upload %s into %s: identical to an earlier upload", file_name, table_obj.name)
+        write_audit(connection, audit, "skipped")
+        return {
+            "message": f"File is identical to an earlier upload into {table_obj.name}; nothing was written.",
+            **summarize_batches([]),
+            "unchanged": None,
+            "statuses_updated": 0,
+            "skipped": True,
+            "batches": [],
+        }
+
+    # Validate the whole file first, so a bad upload fails before anything is written. The CSV
+    # is parsed and coerced once, chunk by chunk; the coerced chunks are spooled to a temporary
+    # file and replayed into the bulk writer, so memory stays flat regardless of the file size.
+    if job:
+        job.set_phase("validating")
+    report = ValidationReport()
+    key_chunks = []
+    first_line = FIRST_DATA_LINE
+    spool = ChunkSpool()
+    try:
+        for chunk_no, df in enumerate(read_csv_chunks(fileobj, chunk_size)):
+            if chunk_no == 0 and not table_columns.issubset(set(df.columns)):
+                raise HTTPException(status_code=400, detail=f"CSV must contain columns: {table_columns}")
+            spool.append(validate_chunk(table_obj, df, report, key_chunks, first_line))
+            first_line += len(df)
+        validate_keys(table_obj, report, key_chunks)
+        if report:
+            raise HTTPException(status_code=400, detail=report.to_dict(table_obj.name))
+    except Exception:
+        spool.close()
+        raise
+
+    batches = []
+    statuses_updated = 0
+    total_rows = 0
+    unchanged = 0
+    # Iterations whose ITERATION_OFFER rows this upload may change, for the summary refresh.
+    summary_iterations = set()
+
+    for chunk in spool.replay():
+        total_rows += len(chunk)
+        if job:
+            job.set_phase("ingesting")
+        df, hashes = changed_rows(connection, table_obj, chunk, hash_context, force=force)
+        unchanged += len(chunk) - len(df)
+        bulk_upsert(connection, table_obj, df, batch_size=batch_size, batches=batches)
+        record_row_hashes(connection, table_obj, hashes)
+        app_nos = df["app_no"].dropna().unique().tolist() if "app_no" in df.columns else []
+        if upper_table in ("FEES_PAID", "ITERATION_OFFER"):
+            fees_frame.mark_dirty(app_nos)
+
+        if job:
+            job.set_phase("recomputing")
+        if upper_table == "ITERATION_OFFER":
+            if latest_iteration is None:
+                if not chunk.empty:
+                    # Stamping the uploaded iteration with the current time makes it the latest one;
+                    # current_iteration picks that up once the upload commits (see notify_ingested).
+                    latest_iteration = int(chunk.iloc[0]["itr_no"])
+                    connection.execute(
+                        upsert_statement(connection, iteration_date_table), [{"iteration": latest_iteration, "date": datetime.now()}]
+                    )
+                else:
+                    latest_iteration = current_iteration.number(connection)
+
+            summary_iterations.update(df["itr_no"].dropna().unique())
+            if latest_iteration is not None:
+                statuses_updated += reconcile_upgrades(connection, app_nos, latest_iteration)
+                summary_iterations.add(latest_iteration)
+
+        elif upper_table == "FEES_PAID":
+            if latest_iteration is not None:
+                statuses_updated += recompute_fee_statuses(connection, app_nos, latest_iteration)
+                summary_iterations.add(latest_iteration)
+
+        if upper_table in ("ITERATION_OFFER", "FEES_PAID", "WITHDRAWS"):
+            refresh_applicant_state(connection, app_nos)
+
+        if job:
+            job.add_rows(len(chunk))
+
+    refresh_iteration_summary(connection, summary_iterations)
+    record_upload(connection, table_obj, file_hash, file_name, total_rows)
+    write_audit(connection, audit, "forced" if force else "uploaded", total_rows)
+
+    return {
+        "message": f"Data updated successfully in {table_obj.name}!",
+        **summarize_batches(batches),
+        "unchanged": unchanged,
+        "statuses_updated": statuses_updated,
+        "skipped": False,
+        "batches": batches,
+    }
+
+
+def notify_ingested(table_obj):
+    """Invalidates caches once an upload into `table_obj` has committed."""
+    # Status recomputation writes ITERATION_OFFER, and iteration uploads also write ITERATION_DATE.
+    changed = {"ITERATION_OFFER": ["ITERATION_DATE"], "FEES_PAID": ["ITERATION_OFFER"]}
+    tables_changed(table_obj.name, *changed.get(table_obj.name.upper(), []))
+
+
+def ingest_csv(fileobj, table_obj, batch_size: int = INGEST_BATCH_SIZE, chunk_size: int = INGEST_CHUNK_SIZE, force: bool = False, audit: UploadAudit = None, job=None, file_name: str = None):
+    """
+    Runs ingest_csv_rows in its own transaction on the sync engine, from a worker thread or a
+    background job. Logs a failed upload to the audit trail before re-raising.
+    """
+    if audit:
+        audit.start()
+    try:
+        with engine.begin() as connection:
+            summary = ingest_csv_rows(
+                connection, fileobj, table_obj, batch_size, chunk_size,
+                job=job, file_name=job.file_name if job else file_name, force=force, audit=audit,
+            )
+    except Exception:
+        write_failed_audit(engine, audit)
+        raise
+    notify_ingested(table_obj)
+    return summary
+
+
 @router.post("/update/{table_name}")
-async def update_data(table_name: str, file: UploadFile):
+async def update_data(
+    table_name: str,
+    file: UploadFile,
+    request: Request,
+    batch_size: int = Query(INGEST_BATCH_SIZE, gt=0),
+    chunk_size: int = Query(INGEST_CHUNK_SIZE, gt=0),
+    background: bool = Query(False, description="Process the upload as a background job"),
+    force: bool = Query(False, description="Write every row even if the file or rows were uploaded before"),
+    uploaded_by: str = Depends(current_user_name),
+):
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-        
         table_obj = metadata.tables.get(table_name)
         if table_obj is None:
             raise HTTPException(status_code=400, detail=f"Table {table_name} does not exist.")
-        table_columns = set(table_obj.columns.keys())
-        if not table_columns.issubset(set(df.columns)):
-            raise HTTPException(status_code=400, detail=f"CSV must contain columns: {table_columns}")
-        
-        with engine.begin() as connection:
-            for _, row in df.iterrows():
-                row = clean_nan_values(dict(row))
-                primary_keys = [col.name for col in table_obj.primary_key]
-                stmt = insert(table_obj).values(row)
-                stmt = stmt.on_duplicate_key_update(
-                    {key: row[key] for key in row.keys() if key not in primary_keys}
-                )
-                connection.execute(stmt)
-            
-            upper_table = table_name.upper()
-            if upper_table == "ITERATION_OFFER":
-                if not df.empty:
-                    iteration_value = df.iloc[0]["itr_no"]
-                    current_time = datetime.now()
-                    stmt = insert(iteration_date_table).values(iteration=iteration_value, date=current_time)
-                    stmt = stmt.on_duplicate_key_update(date=current_time)
-                    connection.execute(stmt)
-
-                result = connection.execute(
-                    iteration_date_table.select().order_by(iteration_date_table.c.date.desc()).limit(1)
-                )
-                latest_iteration_record = result.fetchone()
-                if latest_iteration_record is not None:
-                    latest_iteration = latest_iteration_record[0]
-    
-                    fees_records = connection.execute(
-                        fees_paid_table.select()
-                        )  .mappings().all()
-    
-                    for row in fees_records:
-                        app_no = row["app_no"]
-                        admission_paid = bool(row["admission_fees_status"])
-                        tuition_paid = bool(row["tution_fees_status"])
-
-                        new_status = None
-
-                        if admission_paid and tuition_paid:
-                            iteration_result = connection.execute(
-                                iteration_offer_table.select()
-                                .where(iteration_offer_table.c.app_no == app_no)
-                                .order_by(iteration_offer_table.c.itr_no.desc())
-                                .limit(2)
-                                ).mappings().all()  # This ensures you get dictionaries instead of tuples
-
-                            iterations = iteration_result
-                            
-                            if len(iterations) == 2 and iterations[0]["offer"] != iterations[1]["offer"] and "accept" in iterations[1]["status"]:
-                                new_status = "accept & upgraded"
-                                #print("AU->  ",app_no , admission_paid, tuition_paid)
-                                #print(iteration_result)
-                            
-                        if new_status!= None:
-                            update_stmt = iteration_offer_table.update().where(
-                                and_(
-                                    iteration_offer_table.c.app_no == app_no,
-                                    iteration_offer_table.c.itr_no == latest_iteration
-                                )
-                            ).values(status=new_status)
-                            connection.execute(update_stmt)
-
-
-
-            elif upper_table == "FEES_PAID":
-                result = connection.execute(
-                    iteration_date_table.select().order_by(iteration_date_table.c.date.desc()).limit(1)
-                )
-                latest_iteration_record = result.fetchone()
-                if latest_iteration_record is not None:
-                    latest_iteration = latest_iteration_record[0]
-                    for _, row in df.iterrows():
-                        app_no = row["app_no"]
-                        admission_paid = bool(row["admission_fees_status"])
-                        tuition_paid = bool(row["tution_fees_status"])
-                        
-                        if admission_paid and tuition_paid:
-                            #print(app_no , admission_paid, tuition_paid)
-                            iteration_result = connection.execute(
-                                iteration_offer_table.select()
-                                .where(iteration_offer_table.c.app_no == app_no)
-                                .order_by(iteration_offer_table.c.itr_no.desc())
-                                .limit(2)
-                            ).mappings().all() 
-                            iterations = iteration_result   
-                            if len(iterations) == 2 and iterations[0]["offer"] != iterations[1]["offer"] and "accept" in iterations[1]["status"]:
-                                new_status = "accept & upgraded"
-                                #print("AU->  ",app_no , admission_paid, tuition_paid)
-                                #print(iteration_result)
-                            else:
-                                #print(app_no , admission_paid, tuition_paid)
-                                new_status = "accept"
-                        elif not admission_paid and not tuition_paid:
-                            new_status = "withdraw"
-                        elif admission_paid and not tuition_paid:
-                            latest_offer_result = connection.execute(
-                                iteration_offer_table.select()
-                                .where(
-                                    and_(
-                                        iteration_offer_table.c.app_no == app_no,
-                                        iteration_offer_table.c.itr_no == latest_iteration
-                                    )
-                                )
-                            ).fetchone()
-                            latest_offer = latest_offer_result[2] if latest_offer_result else None
-                            
-                            if latest_offer == "WL":
-                                new_status = "upgrade"
-                            else :
-                                new_status = "withdraw"
-                        else:
-                            #print("w "  , app_no , admission_paid, tuition_paid)
-                          # both not paid 
-                          # waitlist -> both not paid 
-                            new_status = "withdraw"
-                        
-                        update_stmt = iteration_offer_table.update().where(
-                            and_(
-                                iteration_offer_table.c.app_no == app_no,
-                                iteration_offer_table.c.itr_no == latest_iteration
-                            )
-                        ).values(status=new_status)
-                        connection.execute(update_stmt)
-
-        
-        return JSONResponse(content={"message": f"Data updated successfully in {table_name}!"}, status_code=200)
+        client_ip = request.client.host if request.client else None
+
+        if background:
+            audit = UploadAudit(file.filename, table_obj.name, uploaded_by, client_ip)
+            job = jobs.submit(f"update/{table_name}", file, ingest_csv, table_obj, batch_size, chunk_size, force, audit)
+            return JSONResponse(
+                content={"message": "Upload queued.", "job_id": job.id, "status_url": f"/api/jobs/{job.id}"},
+                status_code=202,
+            )
+
+        # The pandas/bulk-write pipeline is synchronous and CPU-heavy, so it runs on the sync
+        # engine in a worker thread; the event loop keeps serving other requests meanwhile.
+        # ingest_csv (like the background job) logs its own outcome to the audit trail.
+        audit = UploadAudit(file.filename, table_obj.name, uploaded_by, client_ip)
+        summary = await run_in_threadpool(
+            ingest_csv, file.file, table_obj, batch_size, chunk_size, force, audit, file_name=file.filename
+        )
+        return JSONResponse(content=summary, status_code=200)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error updating data for table %s", table_name)
         raise HTTPException(status_code=500, detail=str(e))
@@ -189,7 +334,7 @@ async def update_data(table_name: str, file: UploadFile):
 
 
 @router.post("/update_LOGS_TABLE")
-async def update_log_table(request: Request):
+async def update_log_table(request: Request, session: AsyncSession = Depends(get_db)):
     try:
         data = await request.json()  # Get JSON data from request
         user_ip = request.client.host  # Get client IP address
@@ -215,38 +360,10 @@ async def update_log_table(request: Request):
             ip_address=user_ip
         )
 
-        with engine.begin() as connection:
-            connection.execute(stmt)
+        await session.execute(stmt)
+        await session.commit()
 
         return JSONResponse(content={"message": "Log entry added successfully!"}, status_code=201)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-
-
-"""
-
-        print("now updating logtable")
-        session = requests.Session()
-        user_url = "http://localhost:8000/api/user"
-        user_response = session.get(user_url)
-        print("now updating logtable")
-        if user_response.status_code == 200:
-            user_name = user_response.json().get("name", "Unknown User")  # Default to 'Unknown User' if not found
-        else:
-            user_name = "Unknown User"
-            print(f"Error fetching user: {user_response.text}")
-        print("now updating logtable")
-        url = "http://localhost:8000/update_LOGS_TABLE"  # Replace with your actual API URL
-        data = {
-                "file_name": file.filename,
-                "category": upper_table,
-                "uploaded_by": user_name,
-                "remark": "Initial upload"
-            }
-        print("now updating logtable")
-        response = requests.post(url, json=data)
-        print(response)
-
-"""
\ No newline at end of file
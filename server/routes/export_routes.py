@@ -0,0 +1,154 @@
+# routes/export_routes.py
+import io
+import csv
+import zlib
+import logging
+from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Integer, DateTime
+from db import async_engine, master_table, iteration_offer_table, fees_paid_table, iteration_date_table, withdraws_table
+from routes.auth_routes import validate_token
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet/Arrow exports are unavailable without pyarrow
+    pa = None
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Rows read from the server-side cursor and encoded per chunk.
+EXPORT_BATCH_SIZE = 10000
+
+# The admissions data tables that can be exported. Users, the audit log and the bookkeeping
+# tables (upload and row hashes, schema version) are never served.
+EXPORT_TABLES = {
+    table_obj.name: table_obj
+    for table_obj in (master_table, iteration_offer_table, fees_paid_table, iteration_date_table, withdraws_table)
+}
+
+EXPORT_FORMATS = {
+    "csv": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+}
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file object that buffers what pyarrow writes until it is drained."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def arrow_schema(table_obj):
+    """Builds the Arrow schema from the SQLAlchemy column types instead of inferring it per chunk."""
+    fields = []
+    for column in table_obj.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+async def read_partitions(table_obj):
+    """Yields the table's rows in chunks of EXPORT_BATCH_SIZE tuples from a server-side cursor."""
+    async with async_engine.connect() as connection:
+        result = await connection.stream(table_obj.select().execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+async def export_csv(table_obj):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)  # gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table_obj.columns.keys())
+    async for rows in read_partitions(table_obj):
+        writer.writerows(rows)
+        yield compressor.compress(buffer.getvalue().encode())
+        buffer.seek(0)
+        buffer.truncate()
+    yield compressor.compress(buffer.getvalue().encode()) + compressor.flush()
+
+
+async def record_batches(table_obj, schema):
+    """Converts each chunk of rows into a column-oriented Arrow record batch."""
+    async for rows in read_partitions(table_obj):
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+
+async def export_parquet(table_obj):
+    schema = arrow_schema(table_obj)
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="snappy") as writer:
+        async for batch in record_batches(table_obj, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def export_arrow(table_obj):
+    schema = arrow_schema(table_obj)
+    sink = ChunkSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        async for batch in record_batches(table_obj, schema):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+@router.get("/export/{table_name}")
+async def export_table(
+    table_name: str,
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$"),
+    payload: dict = Depends(validate_token),
+):
+    """
+    Streams a whole table as gzip CSV, Parquet or Arrow IPC (stream format). Requires a logged-in
+    user, and only the tables in EXPORT_TABLES can be exported.
+
+    Rows are read from a server-side cursor in chunks of EXPORT_BATCH_SIZE and encoded per
+    chunk, so the table is never materialized and no per-row JSON encoding is done.
+    Parquet and Arrow require pyarrow to be installed.
+    """
+    table_obj = EXPORT_TABLES.get(table_name)
+    if table_obj is None:
+        raise HTTPException(status_code=400, detail=f"Table {table_name} cannot be exported.")
+    if format != "csv" and pa is None:
+        raise HTTPException(status_code=501, detail=f"Exporting as {format} requires pyarrow.")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    encoders = {"csv": export_csv, "parquet": export_parquet, "arrow": export_arrow}
+    logger.info("Exporting %s as %s for %s", table_name, format, payload.get("sub"))
+    return StreamingResponse(
+        encoders[format](table_obj),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table_name}.{extension}"'},
+    )
@@ -0,0 +1,18 @@
+# routes/job_routes.py
+from fastapi import APIRouter, HTTPException
+from jobs import get_job
+
+router = APIRouter()
+
+
+@router.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    """
+    Returns the progress of a background upload started with `?background=true`:
+    phase (queued, running, ingesting, recomputing, done, failed), rows processed,
+    throughput, errors and, once done, the same result the synchronous upload returns.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job.to_dict()
@@ -0,0 +1,36 @@
+# routes/metrics_routes.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from db import engine, async_engine, checkout_latency, pool_invalidations, pool_status
+from auth import password_pool
+from instrumentation import request_metrics
+
+router = APIRouter()
+# Mounted without the /api prefix, at the path Prometheus scrapes by default.
+prometheus_router = APIRouter()
+
+
+@router.get("/internal/metrics")
+def get_internal_metrics():
+    """
+    Connection pool health: size, in-use and overflow counts of the async (request) and sync
+    (background job) pools, request checkout latency and connections invalidated by pre-ping
+    or errors. Also reports the queue depth and latencies of the bcrypt password pool, per-route
+    request latency percentiles with query counts and DB time, and the recent slow requests.
+    Not cached, so it reflects the pools at the time of the call.
+    """
+    return {
+        "pools": {
+            "async": {**pool_status(async_engine), "invalidated": pool_invalidations["async"]},
+            "sync": {**pool_status(engine), "invalidated": pool_invalidations["sync"]},
+        },
+        "checkout_latency": checkout_latency.to_dict(),
+        "password_pool": password_pool.to_dict(),
+        **request_metrics.to_dict(),
+    }
+
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    """Request latency histograms, per-route query counts and DB time in the Prometheus text format."""
+    return PlainTextResponse(request_metrics.prometheus(), media_type="text/plain; version=0.0.4")
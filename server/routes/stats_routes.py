@@ -1,50 +1,71 @@
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+import os
+from itertools import islice
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Depends, Request
 from sqlalchemy import select, func, update, insert
-from db import SessionLocal, master_table, iteration_offer_table, iteration_date_table,fees_paid_table, withdraws_table
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import engine, get_db, master_table, iteration_offer_table, iteration_date_table,fees_paid_table, withdraws_table, iteration_summary_table, applicant_state_table
 from datetime import datetime
 from fastapi.encoders import jsonable_encoder
-import pandas as pd
-import io
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from ingest import read_csv_chunks, upsert_statement, INGEST_BATCH_SIZE
+from status import ACCEPTED_STATUSES, chunked
+from cache import TTLCache, on_tables_changed, tables_changed
+from search import student_index
+from summary import refresh_iteration_summary, iterations_of, NO_STATUS
+from applicant_state import refresh_applicant_state, state_select
+from fees_analytics import fees_frame, fees_analytics
+from iterations import current_iteration
+from audit import UploadAudit, file_size, write_audit, write_failed_audit
+from routes.auth_routes import current_user_name
+import jobs
 
 
 router = APIRouter()
 
+# Seconds a computed /stats response is served from memory. Uploads and withdrawals clear it
+# as soon as they commit; the TTL only bounds staleness for writes made by other workers.
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 30))
+stats_cache = TTLCache(maxsize=1, ttl=STATS_CACHE_TTL)
+
+# Most search matches read per query while looking for applicants with an offer.
+SEARCH_BATCH_SIZE = 1000
+
+
+@on_tables_changed("MASTER_TABLE", "ITERATION_OFFER", "ITERATION_DATE")
+def invalidate_stats():
+    stats_cache.clear()
+
+
 @router.get("/stats")
-def get_stats():
+async def get_stats(session: AsyncSession = Depends(get_db)):
     """
     Returns statistics including:
       - totalApplications: Total number of applications from MASTER_TABLE.
-      - acceptedStudents: Count of offers with status 'accept' from ITERATION_OFFER.
+      - acceptedStudents: Count of students with an 'accept' or 'accept & upgraded' offer in ITERATION_OFFER.
       - latestIterationNumber and latestIterationDate: The latest iteration details from ITERATION_DATE.
         Defaults: 0 for iteration number and today's date if no record exists.
+    The result is cached in memory (see STATS_CACHE_TTL), so dashboard polling is nearly free.
     """
-    session = SessionLocal()
+    cached = stats_cache.get("stats")
+    if cached is not None:
+        return cached
+
     try:
         # Total applications from MASTER_TABLE.
         stmt_total = select(func.count()).select_from(master_table)
-        total_applications = session.execute(stmt_total).scalar() or 0
-
-        # Count accepted students from ITERATION_OFFER where status is 'accept'.
-        """        stmt_accepted = (
-        select(func.count())
-        .select_from(iteration_offer_table)
-        .where(iteration_offer_table.c.status.in_(["accept",])) #if you want add , "accept & upgraded" in the list
-        )"""
+        total_applications = (await session.execute(stmt_total)).scalar() or 0
 
+        # Count accepted students from ITERATION_OFFER. An IN list (unlike LIKE '%accept%') can use an index on status.
         stmt_accepted = (
         select(func.count(func.distinct(iteration_offer_table.c.app_no)))
         .select_from(iteration_offer_table)
-        .where(iteration_offer_table.c.status.like("%accept%"))#need correction 
+        .where(iteration_offer_table.c.status.in_(ACCEPTED_STATUSES))
         )
-        accepted_students = session.execute(stmt_accepted).scalar() or 0
+        accepted_students = (await session.execute(stmt_accepted)).scalar() or 0
         
-        # Retrieve the latest iteration record (ordered by date descending).
-        stmt_latest = (
-            select(iteration_date_table)
-            .order_by(iteration_date_table.c.date.desc())
-            .limit(1)
-        )
-        latest_record = session.execute(stmt_latest).fetchone()
+        # The latest iteration record, from the shared resolver.
+        latest_record = await current_iteration.resolve_async(session)
 
         if latest_record:
             latest_iteration = latest_record.iteration
@@ -54,21 +75,21 @@ def get_stats():
             latest_iteration = 0
             latest_iteration_date = datetime.now()
 
-        return {
+        stats = {
             "totalApplications": total_applications,
             "acceptedStudents": accepted_students,
             "latestIterationNumber": latest_iteration,
             "latestIterationDate": latest_iteration_date,
         }
+        stats_cache.set("stats", stats)
+        return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
 
 @router.get("/fees")
-def get_fees(query: str):
+async def get_fees(query: str, session: AsyncSession = Depends(get_db)):
     """
     Returns the fees record for a given application number provided via the query parameter.
     
@@ -90,29 +111,55 @@ def get_fees(query: str):
      
     and returns all these column values.
     """
-    session = SessionLocal()
     try:
         stmt = select(fees_paid_table).where(fees_paid_table.c.app_no == query)
         # Use .mappings() to get a dictionary-like result.
-        fees_record = session.execute(stmt).mappings().fetchone()
+        fees_record = (await session.execute(stmt)).mappings().fetchone()
         if not fees_record:
             return {"message": f"No fees record found for application number: {query}"}
         return jsonable_encoder(fees_record)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 
-##############        
+@router.get("/fees/analytics")
+async def get_fees_analytics(
+    itr_no: int = Query(None, description="Only applicants whose latest offer is in this iteration"),
+    offer: str = Query(None, description="Only applicants whose latest offer is this offer"),
+):
+    """
+    Fee collection analytics grouped by iteration and offer (each applicant counted under their
+    latest offer): admission and tuition amounts collected, paid/unpaid counts, and a daily
+    time series of payments and amounts collected.
+    Served from the in-memory frame in fees_analytics.py.
+    """
+    try:
+        # Loading blocks on the sync engine in a worker thread, never on the event loop.
+        frame = await run_in_threadpool(fees_frame.ensure_fresh, engine)
+        return await run_in_threadpool(fees_analytics, frame, itr_no, offer)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-def num_there(s):
-    return any(i.isdigit() for i in s)
 
+def student_records_stmt(app_nos: list):
+    """Name and iteration offer rows of the given applicants; applicants without an offer have no rows."""
+    return (
+        select(
+            master_table.c.app_no,
+            master_table.c.name,
+            iteration_offer_table.c.itr_no,
+            iteration_offer_table.c.offer,
+            iteration_offer_table.c.scholarship,
+            iteration_offer_table.c.status,
+        )
+        .select_from(master_table)
+        .join(iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no)
+        .where(master_table.c.app_no.in_(app_nos))
+    )
 
 
 @router.get("/students")
-def get_student(query: str):
+async def get_student(query: str, limit: int = Query(20, gt=0, le=200, description="Maximum number of applicants returned"), session: AsyncSession = Depends(get_db)):
     """
     Returns the student record along with iteration offer details for a given application number or student name 
     provided via the query parameter.
@@ -121,48 +168,42 @@ def get_student(query: str):
       GET http://localhost:8000/api/students?query=APP001
       GET http://localhost:8000/api/students?query=John%20Doe
 
-    The endpoint queries the master_table and iteration_offer_table:
+    Applicants are looked up in the in-memory prefix index (see search.py), which matches the
+    start of the app_no, its number alone, the full name or any word of the name, and ranks
+    exact matches first. Matches are read from the database in rank order, in growing batches,
+    until `limit` of them turn out to have an iteration offer (applicants without one are not
+    returned):
       - master_table (app_no, name)
       - iteration_offer_table (app_no, itr_no, offer, scholarship, status)
       
     and returns the corresponding student data.
     """
-    session = SessionLocal()
     try:
-        # Check if query is numeric (for app_no) or string (for name)
-        if num_there(query):
-            # If query is a number, search by app_no
-            stmt = (
-                select(
-                    master_table.c.app_no,
-                    master_table.c.name,
-                    iteration_offer_table.c.itr_no,
-                    iteration_offer_table.c.offer,
-                    iteration_offer_table.c.scholarship,
-                    iteration_offer_table.c.status,
-                )
-                .select_from(master_table)
-                .join(iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no)
-                .where(master_table.c.app_no.ilike(f"%{query}%"))
-            )
-        else:
-            # Otherwise, search by name
-            stmt = (
-                select(
-                    master_table.c.app_no,
-                    master_table.c.name,
-                    iteration_offer_table.c.itr_no,
-                    iteration_offer_table.c.offer,
-                    iteration_offer_table.c.scholarship,
-                    iteration_offer_table.c.status,
-                )
-                .select_from(master_table)
-                .join(iteration_offer_table, master_table.c.app_no == iteration_offer_table.c.app_no)
-                .where(master_table.c.name.ilike(f"%{query}%"))
+        await session.run_sync(student_index.ensure_built)
+        matches = student_index.matches(query)
+        student_records = []
+        found = 0
+        batch_size = limit
+        while found < limit:
+            app_nos = list(islice(matches, batch_size))
+            if not app_nos:
+                break
+            batch_size = min(batch_size * 2, SEARCH_BATCH_SIZE)
+
+            # Fetch the offers of this batch, keeping the ranking of the index
+            rank = {app_no: position for position, app_no in enumerate(app_nos)}
+            records = sorted(
+                (await session.execute(student_records_stmt(app_nos))).mappings().all(),
+                key=lambda record: (rank[record["app_no"]], record["itr_no"]),
             )
-
-        # Fetch all matching records
-        student_records = session.execute(stmt).mappings().all()
+            kept = set()
+            for record in records:
+                if record["app_no"] not in kept:
+                    if found == limit:
+                        break
+                    kept.add(record["app_no"])
+                    found += 1
+                student_records.append(record)
 
         if not student_records:
             return {"message": f"No student record found for query: {query}"}
@@ -170,12 +211,31 @@ def get_student(query: str):
         return jsonable_encoder(student_records)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
+
+
+@router.get("/students/{app_no}/state")
+async def get_student_state(app_no: str, session: AsyncSession = Depends(get_db)):
+    """
+    Current state of one applicant from APPLICANT_STATE: latest itr_no, offer, scholarship and
+    status, the fee flags and whether they withdrew. A single primary-key read; applicants the
+    projection has no row for yet are derived from the source tables instead.
+    """
+    try:
+        stmt = select(applicant_state_table).where(applicant_state_table.c.app_no == app_no)
+        state = (await session.execute(stmt)).mappings().fetchone()
+        if state is None:
+            state = (await session.execute(state_select([app_no]))).mappings().fetchone()
+        if state is None:
+            raise HTTPException(status_code=404, detail=f"No offers found for application {app_no}.")
+        return jsonable_encoder(state)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/iterations")
-def get_iteration_details(iteration: int = Query(None, description="Iteration number")):
+async def get_iteration_details(iteration: int = Query(None, description="Iteration number"), session: AsyncSession = Depends(get_db)):
     """
     Fetches iteration details for a given iteration number.
     
@@ -185,7 +245,6 @@ def get_iteration_details(iteration: int = Query(None, description="Iteration nu
     - Offer (offer)
     - Status (status)
     """
-    session = SessionLocal()
     try:
         if iteration is None:
             raise HTTPException(status_code=400, detail="Iteration number is required.")
@@ -198,7 +257,7 @@ def get_iteration_details(iteration: int = Query(None, description="Iteration nu
             iteration_offer_table.c.status
         ).where(iteration_offer_table.c.itr_no == iteration)
 
-        result = session.execute(stmt).mappings().all()
+        result = (await session.execute(stmt)).mappings().all()
 
         if not result:
             return {"message": f"No data found for iteration {iteration}"}
@@ -207,20 +266,56 @@ def get_iteration_details(iteration: int = Query(None, description="Iteration nu
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
+
+@router.get("/iterations/{iteration}/summary")
+async def get_iteration_summary(iteration: int, session: AsyncSession = Depends(get_db)):
+    """
+    Offer/status breakdown of one iteration from the ITERATION_SUMMARY materialization:
+    one row per (offer, status) with the applicant count, scholarship holders and scholarship
+    total, plus per-status totals. Offers that have no status yet are reported with status None.
+    """
+    try:
+        stmt = (
+            select(
+                iteration_summary_table.c.offer,
+                iteration_summary_table.c.status,
+                iteration_summary_table.c.applicants,
+                iteration_summary_table.c.scholarship_holders,
+                iteration_summary_table.c.scholarship_total,
+            )
+            .where(iteration_summary_table.c.itr_no == iteration)
+            .order_by(iteration_summary_table.c.offer, iteration_summary_table.c.status)
+        )
+        rows = [dict(row) for row in (await session.execute(stmt)).mappings()]
+
+        if not rows:
+            return {"message": f"No data found for iteration {iteration}"}
+
+        by_status = {}
+        for row in rows:
+            if row["status"] == NO_STATUS:
+                row["status"] = None
+            by_status[row["status"]] = by_status.get(row["status"], 0) + row["applicants"]
+
+        return {
+            "iteration": iteration,
+            "applicants": sum(row["applicants"] for row in rows),
+            "scholarship_total": sum(row["scholarship_total"] for row in rows),
+            "by_status": [{"status": status, "applicants": count} for status, count in by_status.items()],
+            "summary": rows,
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/iteration-count")
-def get_iteration_count():
-    session = SessionLocal()
+async def get_iteration_count(session: AsyncSession = Depends(get_db)):
     try:
         stmt = select(func.count()).select_from(iteration_date_table)
-        count = session.execute(stmt).scalar() or 0
+        count = (await session.execute(stmt)).scalar() or 0
         return {"count": count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        session.close()
 
 # @router.post("/withdraw")
 # def withdraw_application(request: dict):
@@ -266,59 +361,132 @@ def get_iteration_count():
 #     finally:
 #         session.close()
 
+def withdraw_csv_app_nos(fileobj):
+    """The distinct app_nos of a withdrawal CSV, in file order, and the number of rows read."""
+    app_nos = {}
+    rows = 0
+    # Parse the upload in chunks instead of reading the whole file into memory.
+    for chunk_no, df in enumerate(read_csv_chunks(fileobj)):
+        # Ensure 'app_no' column exists
+        if chunk_no == 0 and "app_no" not in df.columns:
+            raise HTTPException(status_code=400, detail="CSV must contain 'app_no' column")
+        rows += len(df)
+        app_nos.update(dict.fromkeys(str(app_no).strip() for app_no in df["app_no"].dropna()))
+    app_nos.pop("", None)
+    return list(app_nos), rows
+
+
+def applicants_with_offers(connection, app_nos: list):
+    """The subset of app_nos that have at least one ITERATION_OFFER row, one IN (...) query per chunk."""
+    found = set()
+    for chunk in chunked(app_nos):
+        found.update(
+            connection.execute(
+                select(iteration_offer_table.c.app_no).where(iteration_offer_table.c.app_no.in_(chunk)).distinct()
+            ).scalars()
+        )
+    return found
+
+
+def withdraw_csv_rows(connection, fileobj, job=None):
+    """
+    Marks every application in the CSV as withdrawn in ITERATION_OFFER and records it in
+    WITHDRAWS, using the caller's (sync) connection and transaction.
+
+    All app_nos are checked up front, and if any has no iteration offer the upload is rejected
+    with the complete list of them. Otherwise statuses are set with one UPDATE ... WHERE app_no
+    IN (...) per chunk and WITHDRAWS is upserted in executemany batches, so app_nos repeated in
+    the file or withdrawn before are fine.
+    """
+    if job:
+        job.set_phase("validating")
+    app_nos, rows = withdraw_csv_app_nos(fileobj)
+    found = applicants_with_offers(connection, app_nos)
+    missing = [app_no for app_no in app_nos if app_no not in found]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "message": f"{len(missing)} application(s) not found in iteration details; nothing was withdrawn.",
+                "missing": missing,
+            },
+        )
+
+    if job:
+        job.set_phase("withdrawing")
+    now = datetime.now()
+    for chunk in chunked(app_nos, INGEST_BATCH_SIZE):
+        connection.execute(
+            update(iteration_offer_table).where(iteration_offer_table.c.app_no.in_(chunk)).values(status="withdraw")
+        )
+        connection.execute(
+            upsert_statement(connection, withdraws_table),
+            [{"app_no": app_no, "date": now, "uploaded_by": "Admin", "upload_date_time": now} for app_no in chunk],
+        )
+        if job:
+            job.add_rows(len(chunk))
+
+    refresh_iteration_summary(connection, iterations_of(connection, app_nos))
+    refresh_applicant_state(connection, app_nos)
+    return {
+        "message": "Withdrawal list processed successfully.",
+        "rows": rows,
+        "withdrawn": len(app_nos),
+    }
+
+
+def withdraw_csv(fileobj, audit: UploadAudit = None, job=None):
+    """
+    Runs withdraw_csv_rows in its own transaction on the sync engine, from a worker thread or a
+    background job. The upload's LOGS_TABLE entry is written in the same transaction, or on its
+    own after a failure, as for /update uploads.
+    """
+    if audit:
+        audit.start()
+        audit.bytes = file_size(fileobj)
+    try:
+        with engine.begin() as connection:
+            result = withdraw_csv_rows(connection, fileobj, job=job)
+            write_audit(connection, audit, "uploaded", result["rows"])
+    except Exception:
+        write_failed_audit(engine, audit)
+        raise
+    tables_changed("ITERATION_OFFER", "WITHDRAWS")
+    return result
+
+
 @router.post("/withdraw/upload")
-async def upload_withdraw_csv(file: UploadFile = File(...)):
+async def upload_withdraw_csv(
+    request: Request,
+    file: UploadFile = File(...),
+    background: bool = Query(False, description="Process the upload as a background job"),
+    uploaded_by: str = Depends(current_user_name),
+):
     """
     Upload a CSV file containing application numbers that need to be withdrawn.
     - Reads the CSV.
     - Marks those applications as "withdrawls" in ITERATION_OFFER.
     - Inserts them into the WITHDRAWS table.
     - Updates Iteration Details accordingly.
+    With `?background=true` the file is queued and a job id is returned at once.
     """
-    session = SessionLocal()
     try:
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
-
-        # Ensure 'app_no' column exists
-        if "app_no" not in df.columns:
-            raise HTTPException(status_code=400, detail="CSV must contain 'app_no' column")
-
-        for _, row in df.iterrows():
-            app_no = row["app_no"]
-
-            # Check if the application exists in iteration offer table
-            stmt_check = select(iteration_offer_table.c.app_no).where(iteration_offer_table.c.app_no == app_no)
-            exists = session.execute(stmt_check).scalar()
-
-            if not exists:
-                raise HTTPException(status_code=404, detail=f"Application {app_no} not found in iteration details.")
-
-            # Update iteration offer status to 'withdrawls'
-            stmt_update = update(iteration_offer_table).where(
-                iteration_offer_table.c.app_no == app_no
-            ).values(status="withdraw")
-            session.execute(stmt_update)
-
-            # Insert withdrawal record
-            stmt_insert = insert(withdraws_table).values(
-                app_no=app_no,
-                date=datetime.now(),
-                uploaded_by="Admin",
-                upload_date_time=datetime.now()
+        client_ip = request.client.host if request.client else None
+        audit = UploadAudit(file.filename, withdraws_table.name, uploaded_by, client_ip)
+        if background:
+            job = jobs.submit("withdraw", file, withdraw_csv, audit)
+            return JSONResponse(
+                content={"message": "Upload queued.", "job_id": job.id, "status_url": f"/api/jobs/{job.id}"},
+                status_code=202,
             )
-            session.execute(stmt_insert)
-
-        session.commit()
-        return {"message": "Withdrawal list processed successfully."}
+        # Parsing and writing are synchronous; run them on the sync engine in a worker thread.
+        return await run_in_threadpool(withdraw_csv, file.file, audit)
 
+    except HTTPException:
+        raise
     except Exception as e:
-        session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-    finally:
-        session.close()
-
 # @router.post("/withdraw/student")
 # def withdraw_student(request: dict):
 #     """
@@ -366,7 +534,7 @@ async def upload_withdraw_csv(file: UploadFile = File(...)):
 #         session.close()
 
 @router.post("/withdraw/student")
-def withdraw_student(request: dict):
+async def withdraw_student(request: dict, session: AsyncSession = Depends(get_db)):
     """
     Withdraw a specific student by application number.
     - Expects a JSON request: { "app_no": "APP12345" }
@@ -374,20 +542,19 @@ def withdraw_student(request: dict):
     - Preserves previous iteration statuses.
     - Adds the student to WITHDRAWS table.
     """
-    session = SessionLocal()
     try:
         app_no = request.get("app_no")
         if not app_no:
             raise HTTPException(status_code=400, detail="Application Number is required.")
 
-        # Fetch the latest iteration number for the given application number
-        stmt_latest = (
-            select(iteration_offer_table.c.itr_no)
-            .where(iteration_offer_table.c.app_no == app_no)
-            .order_by(iteration_offer_table.c.itr_no.desc())
-            .limit(1)
-        )
-        latest_iteration = session.execute(stmt_latest).scalar()
+        # The applicant's latest iteration number, from their APPLICANT_STATE row, or from
+        # ITERATION_OFFER itself while the projection has no row for them (e.g. it was never
+        # backfilled because migrations are disabled).
+        stmt_latest = select(applicant_state_table.c.itr_no).where(applicant_state_table.c.app_no == app_no)
+        latest_iteration = (await session.execute(stmt_latest)).scalar()
+        if latest_iteration is None:
+            stmt_latest = select(func.max(iteration_offer_table.c.itr_no)).where(iteration_offer_table.c.app_no == app_no)
+            latest_iteration = (await session.execute(stmt_latest)).scalar()
 
         if latest_iteration is None:
             raise HTTPException(status_code=404, detail="Application not found in iterations.")
@@ -401,7 +568,7 @@ def withdraw_student(request: dict):
             )
             .values(status="withdraw")
         )
-        session.execute(stmt_update)
+        await session.execute(stmt_update)
 
         # Insert withdrawal record
         stmt_insert = insert(withdraws_table).values(
@@ -410,14 +577,16 @@ def withdraw_student(request: dict):
             uploaded_by="Admin",
             upload_date_time=datetime.now()
         )
-        session.execute(stmt_insert)
+        await session.execute(stmt_insert)
 
-        session.commit()
+        await session.run_sync(refresh_iteration_summary, [latest_iteration])
+        await session.run_sync(refresh_applicant_state, [app_no])
+        await session.commit()
+        tables_changed("ITERATION_OFFER", "WITHDRAWS")
         return {"message": f"Application {app_no} successfully withdrawn for iteration {latest_iteration}."}
 
+    except HTTPException:
+        raise
     except Exception as e:
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-
-    finally:
-        session.close()
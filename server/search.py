@@ -0,0 +1,119 @@
+# search.py
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from itertools import islice
+from sqlalchemy import select
+from db import master_table
+from cache import on_tables_changed
+
+logger = logging.getLogger(__name__)
+
+
+class StudentIndex:
+    """
+    In-memory prefix index over MASTER_TABLE for the student search box.
+
+    Two sorted key lists are kept: full keys (app_no, the numeric part of the app_no and the
+    full name) and single name words. A lookup is a binary search into each list followed by
+    a walk over the matching range, so it costs O(log n + limit) whatever the table size.
+    Results are ranked exact match first, then full-key prefix matches, then name-word prefix
+    matches, each in alphabetical order.
+    """
+
+    def __init__(self):
+        self._full_keys = []
+        self._word_keys = []
+        self._stale = True
+        # Bumped by invalidate, so a build from rows read before a write leaves the index stale.
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text: str):
+        return " ".join(str(text).lower().split())
+
+    @staticmethod
+    def numeric_part(app_no: str):
+        """'APP00513' -> '513', so applicants can be found by their number alone."""
+        digits = re.sub(r"\D", "", app_no).lstrip("0")
+        return digits or None
+
+    def build(self, rows, generation: int = None):
+        """
+        Replaces the index with the given (app_no, name) rows. It is only marked fresh if no
+        invalidation happened since `generation` was read (see ensure_built).
+        """
+        full_keys, word_keys = [], []
+        for app_no, name in rows:
+            app_no_key = self.normalize(app_no)
+            full_keys.append((app_no_key, app_no))
+            number = self.numeric_part(app_no_key)
+            if number:
+                full_keys.append((number, app_no))
+            if name:
+                name_key = self.normalize(name)
+                full_keys.append((name_key, app_no))
+                word_keys.extend((word, app_no) for word in name_key.split(" ")[1:])
+        full_keys.sort()
+        word_keys.sort()
+        with self._lock:
+            self._full_keys, self._word_keys = full_keys, word_keys
+            if generation is None or generation == self._generation:
+                self._stale = False
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+            self._generation += 1
+
+    def ensure_built(self, connection):
+        """
+        Loads MASTER_TABLE into the index if it has never been built or was invalidated.
+        Takes a sync connection or session; async callers use `await session.run_sync(student_index.ensure_built)`.
+        """
+        with self._lock:
+            stale, generation = self._stale, self._generation
+        if not stale:
+            return
+        started = time.perf_counter()
+        rows = connection.execute(select(master_table.c.app_no, master_table.c.name)).all()
+        self.build(rows, generation)
+        logger.info("Built student search index over %s applicants in %.1f ms", len(rows), (time.perf_counter() - started) * 1000)
+
+    def matches(self, query: str):
+        """Yields the app_nos matching the query, best matches first, each once (call ensure_built first)."""
+        prefix = self.normalize(query)
+        if not prefix:
+            return
+        if prefix.isdigit():
+            prefix = prefix.lstrip("0") or prefix
+
+        with self._lock:
+            key_lists = (self._full_keys, self._word_keys)
+
+        seen = set()
+        for keys in key_lists:
+            position = bisect_left(keys, (prefix, ""))
+            while position < len(keys):
+                key, app_no = keys[position]
+                if not key.startswith(prefix):
+                    break
+                if app_no not in seen:
+                    seen.add(app_no)
+                    yield app_no
+                position += 1
+
+    def search(self, query: str, limit: int = 20):
+        """Returns up to `limit` app_nos matching the query, best matches first (call ensure_built first)."""
+        return list(islice(self.matches(query), limit))
+
+
+student_index = StudentIndex()
+
+
+@on_tables_changed("MASTER_TABLE")
+def invalidate_student_index():
+    student_index.invalidate()
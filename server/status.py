@@ -0,0 +1,185 @@
+# status.py
+import logging
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, or_, and_
+from db import iteration_offer_table, fees_paid_table
+
+logger = logging.getLogger(__name__)
+
+# Status values written to ITERATION_OFFER (see flow.txt)
+ACCEPT = "accept"
+ACCEPT_UPGRADED = "accept & upgraded"
+UPGRADE = "upgrade"
+WITHDRAW = "withdraw"
+ACCEPTED_STATUSES = (ACCEPT, ACCEPT_UPGRADED)
+
+# Number of app_nos per IN (...) list when reading or updating statuses.
+STATUS_CHUNK_SIZE = 1000
+
+
+def chunked(values: list, size: int = STATUS_CHUNK_SIZE):
+    """Yields consecutive slices of at most `size` items."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def ranked_offers(app_nos: list):
+    """
+    Subquery over the ITERATION_OFFER rows of the given app_nos with a `rank` column
+    numbering each applicant's iterations from the latest (rank 1) backwards.
+    """
+    return (
+        select(
+            iteration_offer_table.c.app_no,
+            iteration_offer_table.c.itr_no,
+            iteration_offer_table.c.offer,
+            iteration_offer_table.c.status,
+            func.row_number().over(
+                partition_by=iteration_offer_table.c.app_no,
+                order_by=iteration_offer_table.c.itr_no.desc(),
+            ).label("rank"),
+        )
+        .where(iteration_offer_table.c.app_no.in_(app_nos))
+        .subquery()
+    )
+
+
+def offers_frame(connection, stmt):
+    """Runs a query over ranked_offers and returns the rows as a DataFrame."""
+    return pd.DataFrame(connection.execute(stmt).mappings().all(), columns=["app_no", "itr_no", "offer", "status", "rank"])
+
+
+def recent_offers(connection, app_nos: list, latest_iteration: int):
+    """
+    Returns the two most recent ITERATION_OFFER rows of every app_no (rank 1 is the latest)
+    plus the row for `latest_iteration`, as a DataFrame, using a single windowed query.
+    """
+    ranked = ranked_offers(app_nos)
+    return offers_frame(
+        connection,
+        select(ranked).where(or_(ranked.c.rank <= 2, ranked.c.itr_no == latest_iteration)),
+    )
+
+
+def upgraded_app_nos(offers: pd.DataFrame):
+    """
+    Returns the app_nos whose latest offer differs from the previous one while the previous
+    iteration was accepted, i.e. the students who should become "accept & upgraded".
+    """
+    latest = offers[offers["rank"] == 1].set_index("app_no")
+    previous = offers[offers["rank"] == 2].set_index("app_no")
+    latest = latest.loc[latest.index.intersection(previous.index)]
+    previous = previous.loc[latest.index]
+    upgraded = (latest["offer"] != previous["offer"]) & previous["status"].str.contains(ACCEPT, regex=False, na=False)
+    return set(latest.index[upgraded.to_numpy()])
+
+
+def derive_fee_statuses(fees: pd.DataFrame, offers: pd.DataFrame, latest_iteration: int):
+    """
+    Applies the flow.txt rules to a frame of fee rows (app_no, admission_fees_status,
+    tution_fees_status) and returns a Series of new statuses indexed by app_no:
+
+      - both fees paid        -> "accept & upgraded" if upgraded from an accepted offer, else "accept"
+      - admission fees only   -> "upgrade" if the latest iteration offer is WL, else "withdraw"
+      - otherwise             -> "withdraw"
+    """
+    admission_paid = fees["admission_fees_status"].fillna(0).astype(bool).to_numpy()
+    tuition_paid = fees["tution_fees_status"].fillna(0).astype(bool).to_numpy()
+
+    upgraded = fees["app_no"].isin(upgraded_app_nos(offers)).to_numpy()
+    waitlisted_app_nos = offers.loc[
+        (offers["itr_no"] == latest_iteration) & (offers["offer"] == "WL"), "app_no"
+    ]
+    waitlisted = fees["app_no"].isin(waitlisted_app_nos).to_numpy()
+
+    statuses = np.select(
+        [
+            admission_paid & tuition_paid & upgraded,
+            admission_paid & tuition_paid,
+            admission_paid & ~tuition_paid & waitlisted,
+        ],
+        [ACCEPT_UPGRADED, ACCEPT, UPGRADE],
+        default=WITHDRAW,
+    )
+    return pd.Series(statuses, index=fees["app_no"].to_numpy())
+
+
+def apply_statuses(connection, statuses: pd.Series, iteration: int):
+    """
+    Writes the new statuses onto the given iteration's ITERATION_OFFER rows with one
+    UPDATE ... WHERE app_no IN (...) per distinct status and chunk. Returns rows updated.
+    """
+    updated = 0
+    for status, group in statuses.groupby(statuses):
+        for app_nos in chunked(list(group.index)):
+            result = connection.execute(
+                iteration_offer_table.update()
+                .where(
+                    and_(
+                        iteration_offer_table.c.itr_no == iteration,
+                        iteration_offer_table.c.app_no.in_(app_nos),
+                    )
+                )
+                .values(status=status)
+            )
+            updated += result.rowcount
+    return updated
+
+
+def recompute_fee_statuses(connection, app_nos: list, latest_iteration: int):
+    """
+    Recomputes the latest iteration status of the given applicants from their FEES_PAID rows.
+    Costs two reads per chunk of app_nos plus at most one UPDATE per status value.
+    Returns the number of ITERATION_OFFER rows updated.
+    """
+    updated = 0
+    for chunk in chunked(list(app_nos)):
+        fees = pd.DataFrame(
+            connection.execute(
+                select(
+                    fees_paid_table.c.app_no,
+                    fees_paid_table.c.admission_fees_status,
+                    fees_paid_table.c.tution_fees_status,
+                ).where(fees_paid_table.c.app_no.in_(chunk))
+            ).mappings().all(),
+            columns=["app_no", "admission_fees_status", "tution_fees_status"],
+        )
+        if fees.empty:
+            continue
+        offers = recent_offers(connection, chunk, latest_iteration)
+        statuses = derive_fee_statuses(fees, offers, latest_iteration)
+        updated += apply_statuses(connection, statuses, latest_iteration)
+
+    logger.info("Recomputed fee statuses for %s applicants, %s rows updated", len(app_nos), updated)
+    return updated
+
+
+def reconcile_upgrades(connection, app_nos: list, latest_iteration: int):
+    """
+    Marks the latest iteration row "accept & upgraded" for those of the given applicants who
+    have paid both fees and were upgraded from an accepted offer. Only the given app_nos are
+    considered, so an ITERATION_OFFER upload costs one joined read per chunk of its own rows.
+    Returns the number of ITERATION_OFFER rows updated.
+    """
+    updated = 0
+    for chunk in chunked(list(app_nos)):
+        ranked = ranked_offers(chunk)
+        offers = offers_frame(
+            connection,
+            select(ranked)
+            .join(fees_paid_table, fees_paid_table.c.app_no == ranked.c.app_no)
+            .where(
+                and_(
+                    ranked.c.rank <= 2,
+                    fees_paid_table.c.admission_fees_status != 0,
+                    fees_paid_table.c.tution_fees_status != 0,
+                )
+            ),
+        )
+        upgraded = sorted(upgraded_app_nos(offers))
+        if upgraded:
+            updated += apply_statuses(connection, pd.Series(ACCEPT_UPGRADED, index=upgraded), latest_iteration)
+
+    logger.info("Reconciled upgrades for %s uploaded applicants, %s rows updated", len(app_nos), updated)
+    return updated
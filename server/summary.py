@@ -0,0 +1,73 @@
+# summary.py
+"""
+Maintenance of the ITERATION_SUMMARY materialization.
+
+Every write path that changes ITERATION_OFFER (uploads, fee status recomputation and
+withdrawals) calls refresh_iteration_summary for the iterations it touched, inside its own
+transaction, so the summary commits or rolls back together with the rows it describes.
+A refresh re-aggregates whole iterations with one DELETE and one INSERT ... SELECT ... GROUP BY,
+served by the (itr_no, status) index.
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import select, func, case, literal, DateTime
+from db import iteration_offer_table, iteration_summary_table
+from status import chunked
+
+logger = logging.getLogger(__name__)
+
+# ITERATION_SUMMARY.status for offers that have no status yet (it is part of the primary key).
+NO_STATUS = ""
+
+
+def summary_select(itr_nos: list):
+    """Aggregates ITERATION_OFFER into ITERATION_SUMMARY rows for the given iterations."""
+    offers = iteration_offer_table.c
+    status = func.coalesce(offers.status, NO_STATUS)
+    return (
+        select(
+            offers.itr_no,
+            offers.offer,
+            status.label("status"),
+            func.count().label("applicants"),
+            func.sum(case((offers.scholarship > 0, 1), else_=0)).label("scholarship_holders"),
+            func.coalesce(func.sum(offers.scholarship), 0).label("scholarship_total"),
+            literal(datetime.now(), DateTime).label("updated_at"),
+        )
+        .where(offers.itr_no.in_(itr_nos))
+        .group_by(offers.itr_no, offers.offer, status)
+    )
+
+
+def refresh_iteration_summary(connection, itr_nos):
+    """Rebuilds the ITERATION_SUMMARY rows of the given iterations. Returns the rows written."""
+    itr_nos = sorted({int(itr_no) for itr_no in itr_nos if itr_no is not None})
+    if not itr_nos:
+        return 0
+    connection.execute(iteration_summary_table.delete().where(iteration_summary_table.c.itr_no.in_(itr_nos)))
+    result = connection.execute(
+        iteration_summary_table.insert().from_select(
+            [column.name for column in iteration_summary_table.columns], summary_select(itr_nos)
+        )
+    )
+    logger.info("Refreshed iteration summary for iterations %s (%s rows)", itr_nos, result.rowcount)
+    return result.rowcount
+
+
+def iterations_of(connection, app_nos: list):
+    """Iterations in which any of the given applicants has an offer."""
+    itr_nos = set()
+    for chunk in chunked(list(app_nos)):
+        itr_nos.update(
+            connection.execute(
+                select(iteration_offer_table.c.itr_no).where(iteration_offer_table.c.app_no.in_(chunk)).distinct()
+            ).scalars()
+        )
+    return itr_nos
+
+
+def rebuild_iteration_summary(connection):
+    """Rebuilds ITERATION_SUMMARY for every iteration in ITERATION_OFFER."""
+    connection.execute(iteration_summary_table.delete())
+    itr_nos = connection.execute(select(iteration_offer_table.c.itr_no).distinct()).scalars().all()
+    return refresh_iteration_summary(connection, itr_nos)
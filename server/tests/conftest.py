@@ -0,0 +1,127 @@
+# conftest.py
+"""
+Shared fixtures for the server tests.
+
+The server modules create their engines when db.py is imported, so DATABASE_URL is pointed
+at a scratch SQLite file before anything from the server is imported. Every test starts from
+empty tables and empty in-memory caches.
+
+Run from the repository root or the server directory:
+    python -m pytest server/tests
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(SERVER_DIR, "..")
+SCRATCH_DIR = tempfile.mkdtemp(prefix="server-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(SCRATCH_DIR, 'test.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+sys.path.insert(0, SERVER_DIR)
+
+import pytest
+import pandas as pd
+from fastapi.testclient import TestClient
+from db import metadata, engine
+from cache import tables_changed
+from fees_analytics import fees_frame
+from main import app
+from auth import create_access_token
+
+
+def pytest_unconfigure(config):
+    engine.dispose()
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Recreates every table and drops the caches that hold table contents."""
+    engine.dispose()
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    tables_changed(*metadata.tables)
+    fees_frame.invalidate()
+    yield
+    engine.dispose()
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager: the lifespan (migrations) is not needed on fresh tables.
+    return TestClient(app)
+
+
+@pytest.fixture
+def logged_in(client):
+    """The client with the JWT cookie of a logged-in user."""
+    client.cookies.set("token", create_access_token({"sub": "admin@example.com"}))
+    return client
+
+
+def csv_file(frame: pd.DataFrame, file_name: str = "upload.csv"):
+    """A multipart `files` entry holding the frame as CSV."""
+    return {"file": (file_name, io.BytesIO(frame.to_csv(index=False).encode()), "text/csv")}
+
+
+def upload(client, table_name: str, frame: pd.DataFrame, file_name: str = "upload.csv", **params):
+    """POSTs the frame to /update/{table_name} and returns the response."""
+    return client.post(f"/update/{table_name}", files=csv_file(frame, file_name), params=params)
+
+
+def bundled(file_name: str):
+    """One of the bundled CSVs from the repository root, read as strings."""
+    return pd.read_csv(os.path.join(DATA_DIR, file_name), dtype=str, keep_default_na=False)
+
+
+def master_rows(count: int, name: str = "Test Applicant", start: int = 1):
+    return pd.DataFrame({
+        "app_no": [f"APP{number:05d}" for number in range(start, start + count)],
+        "name": [f"{name} {number}" for number in range(start, start + count)],
+    })
+
+
+def offer_rows(app_nos, itr_no: int = 1, offer: str = "Offer_1", scholarship: int = 20):
+    return pd.DataFrame({
+        "app_no": list(app_nos),
+        "itr_no": itr_no,
+        "offer": offer,
+        "scholarship": scholarship,
+        "uploaded_by": "Test Admin",
+        "upload_datetime": "2025-01-02 9:00:00",
+        "status": "",
+    })
+
+
+def fee_rows(app_nos, admission_paid: int = 1, tuition_paid: int = 1, paid_date: str = "2025-01-03 9:00:00"):
+    return pd.DataFrame({
+        "app_no": list(app_nos),
+        "admission_fees_amount": 1234567,
+        "admission_fees_status": admission_paid,
+        "admission_fees_paid_date": paid_date,
+        "admission_fees_uploaded_by": "Test Admin",
+        "admission_fees_upload_date_time": paid_date,
+        "tution_fees_amount": 7654321,
+        "tution_fees_status": tuition_paid,
+        "tution_fees_paid_date": paid_date,
+        "tution_fees_uploaded_by": "Test Admin",
+        "tution_fees_upload_date_time": paid_date,
+    })
+
+
+def withdraw_file(app_nos, file_name: str = "withdraw.csv"):
+    """A multipart `files` entry holding a one-column app_no withdrawal list."""
+    return {"file": (file_name, io.BytesIO(("app_no\n" + "\n".join(app_nos) + "\n").encode()), "text/csv")}
+
+
+def load_admissions(client, count: int = 10):
+    """Uploads applicants, a first iteration of offers and paid fees for all of them."""
+    app_nos = list(master_rows(count)["app_no"])
+    assert upload(client, "MASTER_TABLE", master_rows(count)).status_code == 200
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos)).status_code == 200
+    assert upload(client, "FEES_PAID", fee_rows(app_nos)).status_code == 200
+    return app_nos
@@ -0,0 +1,49 @@
+# test_applicant_state.py
+"""The APPLICANT_STATE projection across uploads and withdrawals."""
+from conftest import upload, withdraw_file, load_admissions, offer_rows, fee_rows
+from db import engine, applicant_state_table
+from applicant_state import check_applicant_state
+
+
+def test_applicant_state_follows_withdrawal_lists(client):
+    app_nos = load_admissions(client)
+    assert client.post("/api/withdraw/upload", files=withdraw_file(app_nos[:2])).status_code == 200
+
+    with engine.connect() as connection:
+        assert check_applicant_state(connection) == []
+    state = client.get(f"/api/students/{app_nos[0]}/state").json()
+    assert (state["withdrawn"], state["status"]) == (1, "withdraw")
+    assert client.get("/api/students/APP99999/state").status_code == 404
+
+
+def test_applicant_state_follows_uploads_and_single_withdrawals(client):
+    app_nos = load_admissions(client)
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos[:4], itr_no=2, offer="Offer_2")).status_code == 200
+    assert upload(client, "FEES_PAID", fee_rows(app_nos[:2], tuition_paid=0), file_name="fees2.csv").status_code == 200
+
+    response = client.post("/api/withdraw/student", json={"app_no": app_nos[3]})
+    assert response.status_code == 200, response.text
+
+    with engine.connect() as connection:
+        assert check_applicant_state(connection) == []
+    upgraded = client.get(f"/api/students/{app_nos[2]}/state").json()
+    assert (upgraded["itr_no"], upgraded["offer"], upgraded["status"]) == (2, "Offer_2", "accept & upgraded")
+    withdrawn = client.get(f"/api/students/{app_nos[3]}/state").json()
+    assert (withdrawn["itr_no"], withdrawn["withdrawn"], withdrawn["status"]) == (2, 1, "withdraw")
+    unpaid = client.get(f"/api/students/{app_nos[0]}/state").json()
+    assert (unpaid["admission_fees_paid"], unpaid["tution_fees_paid"], unpaid["status"]) == (1, 0, "withdraw")
+
+
+def test_reads_and_withdrawals_without_a_projection_row(client):
+    # As after an upgrade with RUN_MIGRATIONS=0: the projection was never backfilled.
+    app_nos = load_admissions(client, count=3)
+    with engine.begin() as connection:
+        connection.execute(applicant_state_table.delete())
+
+    state = client.get(f"/api/students/{app_nos[1]}/state").json()
+    assert (state["itr_no"], state["status"], state["withdrawn"]) == (1, "accept", 0)
+
+    response = client.post("/api/withdraw/student", json={"app_no": app_nos[0]})
+    assert response.status_code == 200, response.text
+    assert client.get(f"/api/students/{app_nos[0]}/state").json()["status"] == "withdraw"
+    assert client.post("/api/withdraw/student", json={"app_no": "APP99999"}).status_code == 404
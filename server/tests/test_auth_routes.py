@@ -0,0 +1,16 @@
+# test_auth_routes.py
+"""Token validation and the decoded-token cache."""
+import jwt
+from auth import create_access_token
+
+
+def test_cached_payload_is_only_served_for_the_same_token(client):
+    token = create_access_token({"sub": "admin@example.com"})
+    client.cookies.set("token", token)
+    assert client.get("/api/validate-token").status_code == 200
+
+    # Same signature segment, different claims: must be checked, not answered from the cache.
+    header, _, signature = token.split(".")
+    claims = jwt.utils.base64url_encode(b'{"sub":"someone@example.com","exp":9999999999}').decode()
+    client.cookies.set("token", f"{header}.{claims}.{signature}")
+    assert client.get("/api/validate-token").status_code == 401
@@ -0,0 +1,63 @@
+# test_data_routes.py
+"""Keyset pagination and streaming of GET /data/{table_name}."""
+import json
+from conftest import upload, master_rows, offer_rows
+
+
+def read_pages(client, table_name: str, limit: int):
+    rows, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit, **({"after": cursor} if cursor else {})}
+        response = client.get(f"/data/{table_name}", params=params)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        rows.extend(body["data"])
+        pages += 1
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return rows, pages
+
+
+def test_pages_cover_the_table_once_in_key_order(client):
+    assert upload(client, "MASTER_TABLE", master_rows(23)).status_code == 200
+
+    rows, pages = read_pages(client, "MASTER_TABLE", 5)
+    app_nos = [row["app_no"] for row in rows]
+    assert pages == 5
+    assert app_nos == sorted(app_nos)
+    assert len(app_nos) == len(set(app_nos)) == 23
+
+
+def test_composite_key_pagination(client):
+    assert upload(client, "MASTER_TABLE", master_rows(7)).status_code == 200
+    app_nos = master_rows(7)["app_no"]
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos, itr_no=1)).status_code == 200
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos[:4], itr_no=2, offer="Offer_2")).status_code == 200
+
+    rows, _ = read_pages(client, "ITERATION_OFFER", 3)
+    keys = [(row["app_no"], row["itr_no"]) for row in rows]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 11
+
+
+def test_exact_multiple_of_the_page_size_ends_with_an_empty_page(client):
+    assert upload(client, "MASTER_TABLE", master_rows(6)).status_code == 200
+    rows, pages = read_pages(client, "MASTER_TABLE", 3)
+    assert len(rows) == 6
+    assert pages == 3
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get("/data/MASTER_TABLE", params={"limit": 5, "after": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_streamed_rows_match_the_table(client):
+    assert upload(client, "MASTER_TABLE", master_rows(12)).status_code == 200
+
+    ndjson = client.get("/data/MASTER_TABLE", params={"stream": "ndjson"})
+    assert ndjson.status_code == 200
+    assert [json.loads(line)["app_no"] for line in ndjson.text.splitlines()] == list(master_rows(12)["app_no"])
+
+    array = client.get("/data/MASTER_TABLE", params={"stream": "json"})
+    assert len(json.loads(array.text)["data"]) == 12
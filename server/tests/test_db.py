@@ -0,0 +1,25 @@
+# test_db.py
+"""Connection pool checkout accounting."""
+from conftest import upload, master_rows
+from db import engine, async_engine, checkout_latency, TimedQueuePool, TimedAsyncAdaptedQueuePool
+
+
+def test_both_pools_time_their_checkouts():
+    assert isinstance(engine.pool, TimedQueuePool)
+    assert isinstance(async_engine.pool, TimedAsyncAdaptedQueuePool)
+    before = checkout_latency.count
+    with engine.connect():
+        pass
+    assert checkout_latency.count == before + 1
+
+
+def test_cached_responses_do_not_check_out_a_connection(client):
+    assert upload(client, "MASTER_TABLE", master_rows(3)).status_code == 200
+    assert client.get("/api/stats").status_code == 200
+
+    before = checkout_latency.count
+    assert client.get("/api/stats").status_code == 200
+    assert checkout_latency.count == before
+
+    assert client.get("/data/MASTER_TABLE").status_code == 200
+    assert checkout_latency.count == before + 1
@@ -0,0 +1,136 @@
+# test_dedup.py
+"""Re-uploads of identical files and rows (dedup.py)."""
+from sqlalchemy import select, event
+import routes.data_routes as data_routes
+from conftest import upload, master_rows, offer_rows, fee_rows
+from db import engine, master_table, iteration_offer_table, iteration_date_table, logs_table
+
+
+def statuses():
+    with engine.connect() as connection:
+        return dict(connection.execute(select(iteration_offer_table.c.app_no, iteration_offer_table.c.status)).all())
+
+
+def test_identical_file_is_skipped(client):
+    assert upload(client, "MASTER_TABLE", master_rows(5)).json()["skipped"] is False
+    summary = upload(client, "MASTER_TABLE", master_rows(5), file_name="again.csv").json()
+    assert summary["skipped"] is True
+    assert summary["inserted"] == summary["updated"] == 0
+
+    forced = upload(client, "MASTER_TABLE", master_rows(5), file_name="forced.csv", force=True).json()
+    assert (forced["skipped"], forced["updated"]) == (False, 5)
+
+    with engine.connect() as connection:
+        remarks = connection.execute(select(logs_table.c.file_name, logs_table.c.remark).order_by(logs_table.c.upload_date)).all()
+    assert [remark for _, remark in remarks] == ["uploaded", "skipped", "forced"]
+
+
+def test_only_changed_rows_are_written(client):
+    assert upload(client, "MASTER_TABLE", master_rows(5)).status_code == 200
+    changed = master_rows(5)
+    changed.loc[2, "name"] = "Someone Else"
+    summary = upload(client, "MASTER_TABLE", changed, file_name="changed.csv").json()
+    assert (summary["updated"], summary["unchanged"]) == (1, 4)
+    with engine.connect() as connection:
+        assert connection.execute(select(master_table.c.name).where(master_table.c.app_no == "APP00003")).scalar() == "Someone Else"
+
+
+def test_fees_are_reprocessed_after_corrected_offers(client):
+    app_nos = list(master_rows(3)["app_no"])
+    assert upload(client, "MASTER_TABLE", master_rows(3)).status_code == 200
+    offers = offer_rows(app_nos)
+    offers.loc[0, "offer"] = "WL"
+    assert upload(client, "ITERATION_OFFER", offers).status_code == 200
+    fees = fee_rows(app_nos, tuition_paid=0)
+    assert upload(client, "FEES_PAID", fees).status_code == 200
+    # Admission paid only: waitlisted applicants are upgraded, the others withdraw.
+    assert statuses()[app_nos[0]] == "upgrade"
+
+    # The corrected offers file rewrites the applicant's row, status included.
+    corrected = offer_rows(app_nos)
+    assert upload(client, "ITERATION_OFFER", corrected, file_name="corrected.csv").status_code == 200
+    assert not statuses()[app_nos[0]]
+
+    summary = upload(client, "FEES_PAID", fees, file_name="fees_again.csv").json()
+    assert summary["skipped"] is False
+    assert statuses()[app_nos[0]] == "withdraw"
+
+    # With nothing changed in between, the same fees file is skipped.
+    assert upload(client, "FEES_PAID", fees, file_name="fees_third.csv").json()["skipped"] is True
+
+
+def latest_iteration():
+    with engine.connect() as connection:
+        return connection.execute(
+            select(iteration_date_table.c.iteration).order_by(iteration_date_table.c.date.desc()).limit(1)
+        ).scalar()
+
+
+def test_identical_offer_and_fee_files_are_skipped_entirely(client):
+    app_nos = list(master_rows(4)["app_no"])
+    assert upload(client, "MASTER_TABLE", master_rows(4)).status_code == 200
+    first = offer_rows(app_nos)
+    assert upload(client, "ITERATION_OFFER", first).status_code == 200
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos[:2], itr_no=2, offer="Offer_2"), file_name="second.csv").status_code == 200
+    fees = fee_rows(app_nos[:2], admission_paid=0, tuition_paid=0)
+    assert upload(client, "FEES_PAID", fees).status_code == 200
+    assert statuses()[app_nos[0]] == "withdraw"
+
+    # Re-sending the first offers file does not make iteration 1 current again ...
+    summary = upload(client, "ITERATION_OFFER", first, file_name="first_again.csv").json()
+    assert (summary["skipped"], summary["statuses_updated"]) == (True, 0)
+    assert latest_iteration() == 2
+
+    # ... and re-sending the fees file recomputes nothing, even statuses cleared in the database.
+    with engine.begin() as connection:
+        connection.execute(iteration_offer_table.update().values(status=None))
+    summary = upload(client, "FEES_PAID", fees, file_name="fees_again.csv").json()
+    assert (summary["skipped"], summary["statuses_updated"]) == (True, 0)
+    assert not statuses()[app_nos[0]]
+
+    # A forced upload is processed like a first one.
+    summary = upload(client, "ITERATION_OFFER", first, file_name="first_forced.csv", force=True).json()
+    assert summary["skipped"] is False
+    assert latest_iteration() == 1
+
+
+def test_unchanged_rows_keep_database_edits(client):
+    app_nos = list(master_rows(3)["app_no"])
+    assert upload(client, "MASTER_TABLE", master_rows(3)).status_code == 200
+    offers = offer_rows(app_nos)
+    assert upload(client, "ITERATION_OFFER", offers).status_code == 200
+    assert upload(client, "FEES_PAID", fee_rows(app_nos)).status_code == 200
+    assert client.post("/api/withdraw/student", json={"app_no": app_nos[0]}).status_code == 200
+
+    # Only the changed row is written; the withdrawn applicant's unchanged row keeps its status.
+    changed = offer_rows(app_nos)
+    changed.loc[2, "scholarship"] = 50
+    summary = upload(client, "ITERATION_OFFER", changed, file_name="changed.csv").json()
+    assert (summary["updated"], summary["unchanged"]) == (1, 2)
+    assert statuses()[app_nos[0]] == "withdraw"
+
+    # force rewrites every row from the file, blank status included, as uploads did before rows
+    # were deduplicated.
+    summary = upload(client, "ITERATION_OFFER", changed, file_name="forced.csv", force=True).json()
+    assert summary["updated"] == 3
+    assert not statuses()[app_nos[0]]
+
+
+def test_row_hashes_are_written_as_one_executemany(client, monkeypatch):
+    writes = []
+    record_row_hashes = data_routes.record_row_hashes
+
+    def counting_record_row_hashes(connection, table_obj, hashes):
+        executions = []
+        listener = lambda conn, cursor, statement, parameters, context, executemany: executions.append(executemany)
+        event.listen(connection, "before_cursor_execute", listener)
+        try:
+            record_row_hashes(connection, table_obj, hashes)
+        finally:
+            event.remove(connection, "before_cursor_execute", listener)
+        writes.append(executions)
+
+    monkeypatch.setattr(data_routes, "record_row_hashes", counting_record_row_hashes)
+    assert upload(client, "MASTER_TABLE", master_rows(25), chunk_size=10, batch_size=4).status_code == 200
+    # One executemany per CSV chunk, whatever the batch size.
+    assert writes == [[True], [True], [True]]
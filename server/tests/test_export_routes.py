@@ -0,0 +1,27 @@
+# test_export_routes.py
+"""GET /export/{table_name}: who may export and which tables."""
+import io
+import csv
+import gzip
+import pytest
+from conftest import upload, master_rows
+
+
+def test_export_requires_a_logged_in_user(client):
+    assert client.get("/export/MASTER_TABLE").status_code == 401
+
+
+@pytest.mark.parametrize("table_name", ["USERS", "LOGS_TABLE", "UPLOAD_HASHES", "ROW_HASHES", "SCHEMA_VERSION", "NOPE"])
+def test_only_data_tables_are_exported(logged_in, table_name):
+    response = logged_in.get(f"/export/{table_name}")
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"Table {table_name} cannot be exported."
+
+
+def test_csv_export(logged_in):
+    assert upload(logged_in, "MASTER_TABLE", master_rows(12)).status_code == 200
+    response = logged_in.get("/export/MASTER_TABLE")
+    assert response.status_code == 200
+    rows = list(csv.reader(io.StringIO(gzip.decompress(response.content).decode())))
+    assert rows[0] == ["app_no", "name"]
+    assert [row[0] for row in rows[1:]] == list(master_rows(12)["app_no"])
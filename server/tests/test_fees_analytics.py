@@ -0,0 +1,74 @@
+# test_fees_analytics.py
+"""The shared fees analytics frame under concurrent requests and after uploads."""
+import time
+import asyncio
+import threading
+import httpx
+import fees_analytics
+from conftest import upload, master_rows, offer_rows, fee_rows
+from fees_analytics import fees_frame
+from main import app
+
+# Generous for a handful of rows; a deadlocked event loop never finishes at all.
+DEADLOCK_TIMEOUT = 30
+
+
+def load_fees(client, count: int = 20):
+    app_nos = list(master_rows(count)["app_no"])
+    assert upload(client, "MASTER_TABLE", master_rows(count)).status_code == 200
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos)).status_code == 200
+    assert upload(client, "FEES_PAID", fee_rows(app_nos[: count // 2])).status_code == 200
+    return app_nos
+
+
+def slow_loads(monkeypatch, delay: float = 0.2):
+    """Makes every frame load slow enough for concurrent requests to overlap; returns the call log."""
+    calls = []
+    load_frame = fees_analytics.load_frame
+
+    def slow_load_frame(connection, app_nos=None):
+        calls.append(app_nos)
+        time.sleep(delay)
+        return load_frame(connection, app_nos)
+
+    monkeypatch.setattr(fees_analytics, "load_frame", slow_load_frame)
+    return calls
+
+
+def test_concurrent_cold_requests_share_one_load(client, monkeypatch):
+    load_fees(client)
+    fees_frame.invalidate()
+    calls = slow_loads(monkeypatch)
+
+    async def cold_requests():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*(async_client.get("/api/fees/analytics") for _ in range(4)))
+
+    # Run the event loop in its own thread: if a request blocked the loop, the join times out
+    # and the test fails instead of hanging.
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(asyncio.run(cold_requests())), daemon=True)
+    worker.start()
+    worker.join(DEADLOCK_TIMEOUT)
+    assert not worker.is_alive(), "concurrent /api/fees/analytics requests did not finish"
+
+    assert [response.status_code for response in results] == [200] * 4
+    assert len({response.text for response in results}) == 1
+    assert calls == [None]
+    assert results[0].json()["totals"]["applicants"] == 10
+
+
+def test_uploads_refresh_only_the_dirty_applicants(client, monkeypatch):
+    app_nos = load_fees(client)
+    assert client.get("/api/fees/analytics").json()["totals"]["admission_paid"] == 10
+
+    calls = slow_loads(monkeypatch, delay=0)
+    assert upload(client, "FEES_PAID", fee_rows(app_nos[10:15]), file_name="more_fees.csv").status_code == 200
+    totals = client.get("/api/fees/analytics").json()["totals"]
+    assert (totals["applicants"], totals["admission_paid"]) == (15, 15)
+    assert calls == [app_nos[10:15]]
+
+    # Nothing changed since, so the next request reads no rows at all.
+    client.get("/api/fees/analytics")
+    assert len(calls) == 1
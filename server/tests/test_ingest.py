@@ -0,0 +1,72 @@
+# test_ingest.py
+"""Bulk upsert accounting and chunked /update uploads."""
+import pandas as pd
+from sqlalchemy import create_engine, select, func, event
+from conftest import upload, master_rows
+from db import metadata, engine, master_table, logs_table
+from ingest import bulk_upsert, summarize_batches, upsert_statement
+
+
+def test_bulk_upsert_counts_inserts_and_updates():
+    scratch = create_engine("sqlite://")
+    metadata.create_all(scratch)
+    with scratch.begin() as connection:
+        first = bulk_upsert(connection, master_table, master_rows(5), batch_size=2)
+        assert [batch["rows"] for batch in first] == [2, 2, 1]
+        assert summarize_batches(first)["inserted"] == 5
+
+        changed = master_rows(5, name="Renamed", start=4)
+        batches = bulk_upsert(connection, master_table, changed, batch_size=2)
+        summary = summarize_batches(batches)
+        assert (summary["rows"], summary["inserted"], summary["updated"]) == (5, 3, 2)
+
+        names = dict(connection.execute(select(master_table.c.app_no, master_table.c.name)).all())
+    assert len(names) == 8
+    assert names["APP00003"] == "Test Applicant 3"
+    assert names["APP00004"] == "Renamed 4"
+
+
+def test_batches_reuse_one_upsert_statement():
+    scratch = create_engine("sqlite://")
+    metadata.create_all(scratch)
+    executions = []
+
+    @event.listens_for(scratch, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT"):
+            executions.append((statement, executemany, len(parameters) if executemany else 1))
+
+    with scratch.begin() as connection:
+        assert upsert_statement(connection, master_table) is upsert_statement(connection, master_table)
+        bulk_upsert(connection, master_table, master_rows(5), batch_size=2)
+    assert len({statement for statement, _, _ in executions}) == 1
+    assert [(executemany, rows) for _, executemany, rows in executions] == [(True, 2), (True, 2), (False, 1)]
+
+
+def test_chunked_upload_reports_inserted_and_updated_rows(client):
+    response = upload(client, "MASTER_TABLE", master_rows(10), chunk_size=3, batch_size=2)
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert (summary["rows"], summary["inserted"], summary["updated"]) == (10, 10, 0)
+    # 4 chunks (3, 3, 3, 1) of batches of at most 2 rows, numbered across chunks.
+    assert len(summary["batches"]) == 7
+
+    frame = pd.concat([master_rows(6), master_rows(4, name="Renamed", start=7), master_rows(2, start=11)])
+    response = upload(client, "MASTER_TABLE", frame, file_name="second.csv", chunk_size=3, batch_size=2)
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert (summary["inserted"], summary["updated"], summary["unchanged"]) == (2, 4, 6)
+
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(master_table)).scalar() == 12
+        assert connection.execute(select(master_table.c.name).where(master_table.c.app_no == "APP00009")).scalar() == "Renamed 9"
+
+
+def test_each_upload_is_audited_once(client):
+    assert upload(client, "MASTER_TABLE", master_rows(3), file_name="good.csv").status_code == 200
+    bad = master_rows(3).rename(columns={"name": "full_name"})
+    assert upload(client, "MASTER_TABLE", bad, file_name="bad.csv").status_code == 400
+
+    with engine.connect() as connection:
+        entries = connection.execute(select(logs_table.c.file_name, logs_table.c.remark, logs_table.c.rows)).all()
+    assert sorted(entries) == [("bad.csv", "failed", None), ("good.csv", "uploaded", 3)]
@@ -0,0 +1,44 @@
+# test_instrumentation.py
+"""Per-route request metrics from RequestTimingMiddleware."""
+from conftest import upload, master_rows
+from instrumentation import request_metrics, fingerprint
+
+
+def route_queries(method: str, route: str):
+    metrics = request_metrics.routes.get((method, route))
+    return (metrics.queries, sum(metrics.statuses.values())) if metrics else (0, 0)
+
+
+def test_streamed_bodies_are_counted_with_their_request(logged_in):
+    client = logged_in
+    assert upload(client, "MASTER_TABLE", master_rows(5)).status_code == 200
+
+    queries, requests = route_queries("GET", "/export/{table_name}")
+    response = client.get("/export/MASTER_TABLE")
+    assert response.status_code == 200
+    assert route_queries("GET", "/export/{table_name}") == (queries + 1, requests + 1)
+
+    queries, requests = route_queries("GET", "/data/{table_name}")
+    assert client.get("/data/MASTER_TABLE", params={"stream": "ndjson"}).status_code == 200
+    assert route_queries("GET", "/data/{table_name}") == (queries + 1, requests + 1)
+
+
+def test_unmatched_and_failed_requests_are_recorded(client):
+    before = request_metrics.routes.get(("GET", "unmatched"))
+    before = before.statuses.get(404, 0) if before else 0
+    assert client.get("/no/such/route").status_code == 404
+    assert request_metrics.routes[("GET", "unmatched")].statuses[404] == before + 1
+
+    assert client.get("/data/NO_SUCH_TABLE").status_code == 400
+    assert request_metrics.routes[("GET", "/data/{table_name}")].statuses[400] >= 1
+
+
+def test_prometheus_exposition(logged_in):
+    logged_in.get("/export/MASTER_TABLE")
+    text = logged_in.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/export/{table_name}",status="200"}' in text
+    assert "db_queries_total" in text
+
+
+def test_fingerprint_collapses_literals_and_lists():
+    assert fingerprint("SELECT * FROM t WHERE a IN (?, ?, ?) AND b = 'x'  AND c = 5") == "SELECT * FROM t WHERE a IN (...) AND b = ? AND c = ?"
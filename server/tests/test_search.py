@@ -0,0 +1,77 @@
+# test_search.py
+"""GET /api/students: prefix search over MASTER_TABLE, limited to applicants with an offer."""
+import pandas as pd
+from conftest import upload, bundled, master_rows, offer_rows
+from search import StudentIndex
+
+
+def applicants(records):
+    return list(dict.fromkeys(record["app_no"] for record in records))
+
+
+def test_limit_counts_applicants_with_offers(client):
+    # Most applicants in the bundled master file never got an offer.
+    assert upload(client, "MASTER_TABLE", bundled("MasterFile.csv")).status_code == 200
+    assert upload(client, "ITERATION_OFFER", bundled("Iteration Offer 1 (1).csv")).status_code == 200
+
+    response = client.get("/api/students", params={"query": "Michael", "limit": 20})
+    assert response.status_code == 200, response.text
+    records = response.json()
+    assert len(applicants(records)) == 20
+    assert all(record["itr_no"] is not None for record in records)
+    assert all("michael" in record["name"].lower() for record in records)
+
+
+def test_best_matches_without_offers_are_passed_over(client):
+    # The exact and earliest matches have no offer; the only applicants with one rank last.
+    frame = pd.concat([master_rows(30, name="Jordan"), master_rows(3, name="Jordanna", start=31)])
+    assert upload(client, "MASTER_TABLE", frame).status_code == 200
+    offered = list(master_rows(3, start=31)["app_no"])
+    assert upload(client, "ITERATION_OFFER", offer_rows(offered)).status_code == 200
+
+    response = client.get("/api/students", params={"query": "Jordan", "limit": 2})
+    assert response.status_code == 200, response.text
+    assert applicants(response.json()) == offered[:2]
+
+    response = client.get("/api/students", params={"query": "Jordan", "limit": 5})
+    assert applicants(response.json()) == offered
+
+
+def test_every_iteration_of_an_applicant_is_returned(client):
+    assert upload(client, "MASTER_TABLE", master_rows(3)).status_code == 200
+    app_nos = list(master_rows(3)["app_no"])
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos)).status_code == 200
+    assert upload(client, "ITERATION_OFFER", offer_rows(app_nos[:1], itr_no=2, offer="Offer_2")).status_code == 200
+
+    records = client.get("/api/students", params={"query": app_nos[0], "limit": 1}).json()
+    assert [(record["app_no"], record["itr_no"]) for record in records] == [(app_nos[0], 1), (app_nos[0], 2)]
+
+
+def test_no_match(client):
+    assert upload(client, "MASTER_TABLE", master_rows(3)).status_code == 200
+    response = client.get("/api/students", params={"query": "Nobody"})
+    assert response.json() == {"message": "No student record found for query: Nobody"}
+
+
+class RacingConnection:
+    """Reads the given rows while MASTER_TABLE is written (and the index invalidated)."""
+
+    def __init__(self, index: StudentIndex, rows):
+        self.index, self.rows = index, rows
+
+    def execute(self, stmt):
+        self.index.invalidate()
+        return self
+
+    def all(self):
+        return self.rows
+
+
+def test_invalidation_during_a_build_is_not_lost():
+    index = StudentIndex()
+    index.ensure_built(RacingConnection(index, [("APP00001", "Old Name")]))
+    assert index.search("old") == ["APP00001"]
+
+    # The write that raced with the first build is picked up by the next lookup.
+    index.ensure_built(RacingConnection(index, [("APP00001", "New Name")]))
+    assert index.search("new") == ["APP00001"]
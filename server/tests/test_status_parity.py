@@ -0,0 +1,148 @@
+# test_status_parity.py
+"""
+Checks that the set-based status recomputation in status.py produces exactly the same
+ITERATION_OFFER statuses as the original per-row logic, both for FEES_PAID uploads and
+for the "accept & upgraded" reconciliation run on ITERATION_OFFER uploads.
+
+Replays the bundled CSVs (iteration 1, fees 1, iteration 2, fees 2) into two in-memory
+SQLite databases, one per implementation, and compares the resulting tables. The bundled
+files contain no waitlisted offers, so the flow is replayed a second time with every
+seventh offer turned into "WL" to cover the upgrade rule as well.
+"""
+import os
+from datetime import datetime, timedelta
+import pytest
+import pandas as pd
+from sqlalchemy import create_engine, and_, select
+from conftest import DATA_DIR
+from db import metadata, iteration_offer_table, fees_paid_table, iteration_date_table
+from ingest import bulk_upsert, upsert_statement
+from status import recompute_fee_statuses, reconcile_upgrades
+
+FLOW = [
+    ("ITERATION_OFFER", "Iteration Offer 1 (1).csv"),
+    ("FEES_PAID", "Fees_Paid_Iteration_1 (3).csv"),
+    ("ITERATION_OFFER", "Iteration Offer 2.csv"),
+    ("FEES_PAID", "Fees_Paid_Iteration_2.csv"),
+]
+
+
+def legacy_fee_statuses(connection, df, latest_iteration):
+    """The original per-row FEES_PAID status logic from update_data, kept as the reference."""
+    for _, row in df.iterrows():
+        app_no = row["app_no"]
+        admission_paid = bool(row["admission_fees_status"])
+        tuition_paid = bool(row["tution_fees_status"])
+
+        if admission_paid and tuition_paid:
+            iterations = connection.execute(
+                iteration_offer_table.select()
+                .where(iteration_offer_table.c.app_no == app_no)
+                .order_by(iteration_offer_table.c.itr_no.desc())
+                .limit(2)
+            ).mappings().all()
+            if len(iterations) == 2 and iterations[0]["offer"] != iterations[1]["offer"] and "accept" in iterations[1]["status"]:
+                new_status = "accept & upgraded"
+            else:
+                new_status = "accept"
+        elif not admission_paid and not tuition_paid:
+            new_status = "withdraw"
+        elif admission_paid and not tuition_paid:
+            latest_offer_result = connection.execute(
+                iteration_offer_table.select()
+                .where(
+                    and_(
+                        iteration_offer_table.c.app_no == app_no,
+                        iteration_offer_table.c.itr_no == latest_iteration
+                    )
+                )
+            ).fetchone()
+            latest_offer = latest_offer_result[2] if latest_offer_result else None
+            new_status = "upgrade" if latest_offer == "WL" else "withdraw"
+        else:
+            new_status = "withdraw"
+
+        connection.execute(
+            iteration_offer_table.update().where(
+                and_(
+                    iteration_offer_table.c.app_no == app_no,
+                    iteration_offer_table.c.itr_no == latest_iteration
+                )
+            ).values(status=new_status)
+        )
+
+
+def legacy_reconcile_upgrades(connection, df, latest_iteration):
+    """The original ITERATION_OFFER reconciliation from update_data, scanning all of FEES_PAID."""
+    for row in connection.execute(fees_paid_table.select()).mappings().all():
+        app_no = row["app_no"]
+        if bool(row["admission_fees_status"]) and bool(row["tution_fees_status"]):
+            iterations = connection.execute(
+                iteration_offer_table.select()
+                .where(iteration_offer_table.c.app_no == app_no)
+                .order_by(iteration_offer_table.c.itr_no.desc())
+                .limit(2)
+            ).mappings().all()
+            if len(iterations) == 2 and iterations[0]["offer"] != iterations[1]["offer"] and "accept" in iterations[1]["status"]:
+                connection.execute(
+                    iteration_offer_table.update().where(
+                        and_(
+                            iteration_offer_table.c.app_no == app_no,
+                            iteration_offer_table.c.itr_no == latest_iteration
+                        )
+                    ).values(status="accept & upgraded")
+                )
+
+
+def set_based_fee_statuses(connection, df, latest_iteration):
+    recompute_fee_statuses(connection, df["app_no"].dropna().unique().tolist(), latest_iteration)
+
+
+def set_based_reconcile_upgrades(connection, df, latest_iteration):
+    reconcile_upgrades(connection, df["app_no"].dropna().unique().tolist(), latest_iteration)
+
+
+def replay(recompute, reconcile, waitlist_every=0):
+    """Runs the admission flow on a fresh database and returns the final ITERATION_OFFER rows."""
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    upload_time = datetime(2025, 1, 1)
+
+    with engine.begin() as connection:
+        for table_name, file_name in FLOW:
+            df = pd.read_csv(os.path.join(DATA_DIR, file_name))
+            table_obj = metadata.tables[table_name]
+            if table_name == "ITERATION_OFFER" and waitlist_every:
+                df.loc[::waitlist_every, "offer"] = "WL"
+            bulk_upsert(connection, table_obj, df)
+
+            upload_time += timedelta(days=1)
+            if table_name == "ITERATION_OFFER":
+                connection.execute(
+                    upsert_statement(connection, iteration_date_table),
+                    [{"iteration": int(df.iloc[0]["itr_no"]), "date": upload_time}],
+                )
+            latest_iteration = connection.execute(
+                select(iteration_date_table.c.iteration).order_by(iteration_date_table.c.date.desc()).limit(1)
+            ).scalar()
+            if table_name == "ITERATION_OFFER":
+                reconcile(connection, df, latest_iteration)
+            else:
+                recompute(connection, df, latest_iteration)
+
+        rows = connection.execute(
+            select(iteration_offer_table.c.app_no, iteration_offer_table.c.itr_no, iteration_offer_table.c.status)
+        ).all()
+    return pd.DataFrame(rows, columns=["app_no", "itr_no", "status"]).set_index(["app_no", "itr_no"]).sort_index()
+
+
+@pytest.mark.parametrize("waitlist_every", [0, 7])
+def test_set_based_statuses_match_legacy(waitlist_every):
+    expected = replay(legacy_fee_statuses, legacy_reconcile_upgrades, waitlist_every)
+    actual = replay(set_based_fee_statuses, set_based_reconcile_upgrades, waitlist_every)
+
+    merged = expected.join(actual, lsuffix="_legacy", rsuffix="_set_based")
+    mismatches = merged[merged["status_legacy"].fillna("") != merged["status_set_based"].fillna("")]
+
+    assert len(merged) == len(expected) == len(actual)
+    assert mismatches.empty, f"{len(mismatches)} status mismatches:\n{mismatches.head(20).to_string()}"
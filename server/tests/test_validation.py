@@ -0,0 +1,76 @@
+# test_validation.py
+"""Upload validation against the table definitions (validation.py)."""
+import pandas as pd
+from sqlalchemy import select, func
+import routes.data_routes as data_routes
+from conftest import upload, master_rows, offer_rows, fee_rows
+from db import engine, master_table, fees_paid_table, iteration_offer_table
+from validation import ValidationReport, validate_chunk, validate_keys, FIRST_DATA_LINE
+
+
+def validate(table_obj, chunks):
+    report, key_chunks, first_line = ValidationReport(), [], FIRST_DATA_LINE
+    for df in chunks:
+        validate_chunk(table_obj, df, report, key_chunks, first_line)
+        first_line += len(df)
+    validate_keys(table_obj, report, key_chunks)
+    return report.to_dict(table_obj.name)
+
+
+def test_duplicate_keys_within_and_across_chunks():
+    first = pd.DataFrame({"app_no": ["A1", "A2", "A1"], "itr_no": [1, 1, 1], "offer": "O", "uploaded_by": "x"})
+    second = pd.DataFrame({"app_no": ["A2", "A2", "A3"], "itr_no": [2, 1, 1], "offer": "O", "uploaded_by": "x"})
+    report = validate(iteration_offer_table, [first, second])
+    assert report["error_count"] == 2
+    assert [(error["row"], error["value"], error["error"]) for error in report["errors"]] == [
+        (4, "A1, 1", "duplicate primary key (first at row 2)"),
+        (6, "A2, 1", "duplicate primary key (first at row 3)"),
+    ]
+
+
+def test_column_rules():
+    fees = fee_rows(["A1", "A2", "A3", None])
+    fees["admission_fees_status"] = ["1", "2", "x", "0"]
+    fees["tution_fees_paid_date"] = ["2025-01-01", "soon", "2025-01-02", "2025-01-02"]
+    report = validate(fees_paid_table, [fees])
+    errors = {(error["row"], error["column"], error["error"]) for error in report["errors"]}
+    assert errors == {
+        (3, "admission_fees_status", "must be one of [0, 1]"),
+        (4, "admission_fees_status", "not a whole number"),
+        (3, "tution_fees_paid_date", "not a valid date/time"),
+        (5, "app_no", "required value is missing"),
+    }
+
+
+def test_invalid_upload_is_rejected_whole(client):
+    frame = master_rows(5)
+    frame.loc[1, "name"] = "A name that is far too long for the column"
+    frame.loc[3, "app_no"] = frame.loc[0, "app_no"]
+    response = upload(client, "MASTER_TABLE", frame, chunk_size=2)
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["error_count"] == 2
+    assert [(error["row"], error["column"]) for error in detail["errors"]] == [(3, "name"), (5, "app_no")]
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(master_table)).scalar() == 0
+
+
+def test_upload_is_parsed_once(client, monkeypatch):
+    parses = []
+    read_csv_chunks = data_routes.read_csv_chunks
+
+    def counting_read_csv_chunks(*args, **kwargs):
+        parses.append(args)
+        return read_csv_chunks(*args, **kwargs)
+
+    monkeypatch.setattr(data_routes, "read_csv_chunks", counting_read_csv_chunks)
+    assert upload(client, "MASTER_TABLE", master_rows(25), chunk_size=10).status_code == 200
+    app_nos = master_rows(25)["app_no"]
+    response = upload(client, "ITERATION_OFFER", offer_rows(app_nos), chunk_size=10)
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 25
+    assert len(parses) == 2
+
+    with engine.connect() as connection:
+        itr_nos = connection.execute(select(iteration_offer_table.c.itr_no).distinct()).scalars().all()
+    assert itr_nos == [1]
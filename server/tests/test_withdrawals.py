@@ -0,0 +1,55 @@
+# test_withdrawals.py
+"""Set-based processing of withdrawal CSVs (POST /api/withdraw/upload)."""
+from sqlalchemy import select
+from conftest import withdraw_file, load_admissions
+from db import engine, iteration_offer_table, withdraws_table, logs_table
+
+
+def test_withdrawal_list_marks_every_applicant(client):
+    app_nos = load_admissions(client)
+    # Repeated app_nos and blank lines are fine.
+    response = client.post("/api/withdraw/upload", files=withdraw_file([app_nos[0], app_nos[1], "", app_nos[0]]))
+    assert response.status_code == 200, response.text
+    assert response.json()["withdrawn"] == 2
+
+    with engine.connect() as connection:
+        statuses = dict(connection.execute(select(iteration_offer_table.c.app_no, iteration_offer_table.c.status)).all())
+        withdrawn = set(connection.execute(select(withdraws_table.c.app_no)).scalars())
+    assert withdrawn == {app_nos[0], app_nos[1]}
+    assert statuses[app_nos[0]] == statuses[app_nos[1]] == "withdraw"
+    assert statuses[app_nos[2]] == "accept"
+
+    # Withdrawing the same applicants again is not an error.
+    assert client.post("/api/withdraw/upload", files=withdraw_file(app_nos[:3])).status_code == 200
+
+
+def test_withdrawal_list_with_unknown_applicants_is_rejected_whole(client):
+    app_nos = load_admissions(client)
+    response = client.post("/api/withdraw/upload", files=withdraw_file([app_nos[0], "APP99998", "APP99999"]))
+    assert response.status_code == 404
+    assert response.json()["detail"]["missing"] == ["APP99998", "APP99999"]
+
+    with engine.connect() as connection:
+        assert connection.execute(select(withdraws_table.c.app_no)).all() == []
+        status = connection.execute(
+            select(iteration_offer_table.c.status).where(iteration_offer_table.c.app_no == app_nos[0])
+        ).scalar()
+    assert status == "accept"
+
+
+def test_withdrawal_lists_are_audited(client):
+    app_nos = load_admissions(client)
+    files = withdraw_file([app_nos[0], app_nos[1], app_nos[0]], file_name="withdraw_good.csv")
+    assert client.post("/api/withdraw/upload", files=files).status_code == 200
+    files = withdraw_file([app_nos[2], "APP99999"], file_name="withdraw_bad.csv")
+    assert client.post("/api/withdraw/upload", files=files).status_code == 404
+
+    with engine.connect() as connection:
+        entries = connection.execute(
+            select(logs_table.c.file_name, logs_table.c.category, logs_table.c.remark, logs_table.c.rows)
+            .where(logs_table.c.category == "WITHDRAWS")
+        ).all()
+    assert sorted(entries) == [
+        ("withdraw_bad.csv", "WITHDRAWS", "failed", None),
+        ("withdraw_good.csv", "WITHDRAWS", "uploaded", 3),
+    ]
@@ -0,0 +1,147 @@
+# validation.py
+"""
+Validation and coercion of uploaded CSV chunks against the Table definitions in db.py.
+
+Every rule is derived from the Column objects: Integer and DateTime columns must parse,
+String(n) values must fit in n characters, non-nullable and primary-key columns must be
+present, primary keys must be unique within the file, and columns declaring
+info={"allowed_values": ...} (the fee status flags) only accept those values.
+Checks are column-wise pandas/NumPy operations. The ingest pipeline runs them over the whole
+CSV before writing anything, so a bad file is rejected without a rollback.
+"""
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import Integer, String, DateTime
+
+# Errors listed in a validation report; the total count is always reported.
+MAX_REPORTED_ERRORS = int(os.environ.get("MAX_REPORTED_ERRORS", 100))
+
+# CSV line number of the first data row (line 1 is the header).
+FIRST_DATA_LINE = 2
+
+# Separates the values of a composite primary key in key_strings.
+KEY_SEPARATOR = "\x1f"
+
+
+class ValidationReport:
+    """Per-row errors of one upload: CSV line, column, offending value and reason."""
+
+    def __init__(self, max_errors: int = MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.error_count = 0
+        self.errors = []
+
+    def add(self, lines, column: str, values, reason: str):
+        lines = list(lines)
+        self.error_count += len(lines)
+        room = self.max_errors - len(self.errors)
+        for line, value in list(zip(lines, values))[:max(room, 0)]:
+            self.errors.append({"row": int(line), "column": column, "value": None if pd.isna(value) else str(value), "error": reason})
+
+    def __bool__(self):
+        return self.error_count > 0
+
+    def to_dict(self, table_name: str):
+        return {
+            "message": f"CSV failed validation for {table_name}: {self.error_count} error(s), nothing was written.",
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda error: error["row"]),
+        }
+
+
+def coerce_integer(series: pd.Series):
+    """Returns (Int64 series, mask of present values that are not whole numbers)."""
+    numbers = pd.to_numeric(series, errors="coerce")
+    invalid = series.notna() & (numbers.isna() | (numbers % 1 != 0))
+    return numbers.where(~invalid).astype("Int64"), invalid
+
+
+def coerce_datetime(series: pd.Series):
+    """Returns (datetime64 series, mask of present values that are not dates)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series, pd.Series(False, index=series.index)
+    parsed = pd.to_datetime(series, errors="coerce")
+    return parsed, series.notna() & parsed.isna()
+
+
+def coerce_string(series: pd.Series):
+    """Returns the values as strings (whole floats such as 123.0 become '123'), nulls kept."""
+    if pd.api.types.is_float_dtype(series) and (series.dropna() % 1 == 0).all():
+        series = series.astype("Int64")
+    return series.astype(object).where(series.isna(), series.astype(str)).astype(object)
+
+
+def coerce_column(column, series: pd.Series):
+    """Returns (values coerced to the column's SQL type, mask of values that failed to parse or None)."""
+    if isinstance(column.type, Integer):
+        return coerce_integer(series)
+    if isinstance(column.type, DateTime):
+        return coerce_datetime(series)
+    if isinstance(column.type, String):
+        return coerce_string(series), None
+    return series, None
+
+
+def key_strings(df: pd.DataFrame, columns: list):
+    """One string per row identifying its key; composite keys are joined with KEY_SEPARATOR."""
+    keys = df[columns[0]].astype(str)
+    for column in columns[1:]:
+        keys = keys.str.cat(df[column].astype(str), sep=KEY_SEPARATOR)
+    return keys
+
+
+def validate_chunk(table_obj, df: pd.DataFrame, report: ValidationReport, key_chunks: list, first_line: int):
+    """
+    Validates one CSV chunk, adding its errors to `report`, and returns the table's columns
+    coerced to their SQL types. The chunk's primary keys are appended to `key_chunks` (as
+    key strings indexed by CSV line); validate_keys checks them once the whole file is read.
+    """
+    lines = pd.Series(np.arange(first_line, first_line + len(df)), index=df.index)
+    coerced = pd.DataFrame(index=df.index)
+    primary_keys = [column.name for column in table_obj.primary_key]
+
+    for column in table_obj.columns:
+        if column.name not in df.columns:
+            continue
+        series = df[column.name]
+
+        values, invalid = coerce_column(column, series)
+        if invalid is not None:
+            reason = "not a whole number" if isinstance(column.type, Integer) else "not a valid date/time"
+            report.add(lines[invalid], column.name, series[invalid], reason)
+        if isinstance(column.type, String) and column.type.length:
+            too_long = values.notna() & (values.str.len() > column.type.length)
+            report.add(lines[too_long], column.name, values[too_long], f"longer than {column.type.length} characters")
+
+        allowed = column.info.get("allowed_values")
+        if allowed is not None:
+            not_allowed = values.notna() & ~values.isin(allowed)
+            report.add(lines[not_allowed], column.name, values[not_allowed], f"must be one of {list(allowed)}")
+
+        # Values that failed to parse are already reported; only genuinely empty cells count as missing.
+        if not column.nullable and column.autoincrement is not True:
+            missing = series.isna()
+            report.add(lines[missing], column.name, series[missing], "required value is missing")
+
+        coerced[column.name] = values
+
+    if primary_keys and all(key in coerced.columns for key in primary_keys):
+        key_chunks.append(pd.Series(key_strings(coerced, primary_keys).to_numpy(), index=lines.to_numpy()))
+
+    return coerced
+
+
+def validate_keys(table_obj, report: ValidationReport, key_chunks: list):
+    """Reports primary keys repeated anywhere in the file, from the keys collected by validate_chunk."""
+    if not key_chunks:
+        return
+    keys = pd.concat(key_chunks)
+    repeated = keys.duplicated(keep="first")
+    if not repeated.any():
+        return
+    first_lines = pd.Series(keys.index[~repeated.to_numpy()], index=keys[~repeated].to_numpy())
+    duplicates = keys[repeated]
+    column = "+".join(column.name for column in table_obj.primary_key)
+    for line, key, first in zip(duplicates.index, duplicates.to_numpy(), first_lines.reindex(duplicates.to_numpy()).to_numpy()):
+        report.add([line], column, [key.replace(KEY_SEPARATOR, ", ")], f"duplicate primary key (first at row {first})")